@@ -0,0 +1,264 @@
+import math
+import time
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from spatial import points_in_polygon
+from tracking import ObjectType, TrackedFrame
+
+OBJECT_TYPES = tuple(ObjectType)
+_TYPE_INDEX = np.full(max(OBJECT_TYPES) + 1, -1, dtype=np.int64)
+_TYPE_INDEX[[t.value for t in OBJECT_TYPES]] = np.arange(len(OBJECT_TYPES))
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LogBins:
+    """
+    Logarithmic value bins with a relative error of at most `accuracy`, so a
+    distribution over `[min_value, max_value]` is summarised by a fixed, small
+    array of counts (as in DDSketch). Values outside the range are clamped into
+    the first or last bin.
+    """
+
+    def __init__(self, min_value: float, max_value: float, accuracy: float = 0.02):
+        self.min_value = min_value
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.size = int(math.ceil(math.log(max_value / min_value) / self._log_gamma)) + 1
+        # bin i holds (min * gamma^(i-1), min * gamma^i], represented by its point of least relative error
+        self.values = min_value * 2 * self.gamma ** np.arange(self.size) / (self.gamma + 1)
+        self.values[0] = min_value
+
+    def index(self, values: np.ndarray) -> np.ndarray:
+        with np.errstate(divide='ignore'):
+            bins = np.ceil(np.log(np.maximum(values, self.min_value) / self.min_value) / self._log_gamma)
+        return np.minimum(bins.astype(np.int64), self.size - 1)
+
+    def quantiles(self, counts: np.ndarray, quantiles: Sequence[float] = QUANTILES) -> np.ndarray:
+        """Estimate the quantiles of every distribution in `(..., size)` counts, giving `(..., len(quantiles))`.
+        """
+        cumulative = np.cumsum(counts, axis=-1)
+        ranks = cumulative[..., -1:] * np.asarray(quantiles)
+        bins = (cumulative[..., None, :] < ranks[..., None]).sum(axis=-1)
+        return self.values[np.minimum(bins, self.size - 1)]
+
+
+class RollingCounts:
+    """
+    Counts over the last `window_s` seconds, kept as `slices` sub-window arrays of
+    `shape` in a ring. Adding to the current slice is a single `bincount`, and a
+    slice is cleared when the window moves past it, so memory never grows.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], window_s: float, slices: int = 10):
+        self.shape = shape
+        self.slice_s = window_s / slices
+        self._size = int(np.prod(shape))
+        self._slices = np.zeros((slices, self._size), dtype=np.int64)
+        self._current: Optional[int] = None
+
+    def advance(self, t: float):
+        current = int(t // self.slice_s)
+        if self._current is not None and current > self._current:
+            stale = np.arange(self._current + 1, min(current, self._current + len(self._slices)) + 1)
+            self._slices[stale % len(self._slices)] = 0
+        if self._current is None or current > self._current:
+            self._current = current
+
+    def add(self, index: Tuple[np.ndarray, ...]):
+        """Count one event at each multi-index of the current slice.
+        """
+        flat = np.ravel_multi_index(index, self.shape)
+        self._slices[self._current % len(self._slices)] += np.bincount(flat, minlength=self._size)
+
+    def total(self) -> np.ndarray:
+        return self._slices.sum(axis=0).reshape(self.shape)
+
+
+def _parse_zone(name: str, points: Sequence[float]) -> np.ndarray:
+    if len(points) < 6 or len(points) % 2:
+        raise ValueError(f"Zone {name!r} must hold at least three x,y pairs")
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+
+def _parse_line(name: str, points: Sequence[float]) -> np.ndarray:
+    if len(points) != 4:
+        raise ValueError(f"Line {name!r} must be x0,y0,x1,y1")
+    return np.asarray(points, dtype=np.float64).reshape(2, 2)
+
+
+def _cross(ax: np.ndarray, ay: np.ndarray, bx: np.ndarray, by: np.ndarray) -> np.ndarray:
+    return ax * by - ay * bx
+
+
+class TrafficAnalytics:
+    """
+    Incremental traffic statistics of one camera, updated once per tick with a
+    fixed number of vectorised operations regardless of the number of objects:
+
+    - occupancy: objects currently inside each zone (a polygon in map coordinates),
+    - entries: objects entering each zone during the window,
+    - crossings: objects crossing each line during the window, `forward` meaning
+      to the right of the line looking from its first point to its second (as
+      drawn on the map) and `backward` the opposite,
+    - dwell: quantiles of the time objects spent in each zone, counted on leaving,
+    - speed: quantiles of object speeds (map units per second), over the whole scene
+      and per zone,
+
+    all broken down by :class:`~.ObjectType`. Counts cover the last `window_s`
+    seconds and distributions are kept in fixed logarithmic bins, so memory is
+    bounded by the number of zones, lines and types.
+    """
+    SPEED_BINS = LogBins(0.5, 5000.0)
+    DWELL_BINS = LogBins(0.1, 24 * 3600.0)
+
+    def __init__(self, zones: Optional[Mapping[str, Sequence[float]]] = None,
+                 lines: Optional[Mapping[str, Sequence[float]]] = None, window_s: float = 300.0, slices: int = 10):
+        """
+        Raises:
+            ValueError: If a zone or line is malformed.
+        """
+        self.zone_names = list(zones or {})
+        self.zones = [_parse_zone(name, points) for name, points in (zones or {}).items()]
+        self._zone_bboxes = [(zone.min(axis=0), zone.max(axis=0)) for zone in self.zones]
+        self.line_names = list(lines or {})
+        line_points = np.array([_parse_line(name, points) for name, points in (lines or {}).items()]).reshape(-1, 2, 2)
+        self._line_start = line_points[:, 0]
+        self._line_dir = line_points[:, 1] - line_points[:, 0]
+        self.window_s = window_s
+        zone_count, type_count = len(self.zones), len(OBJECT_TYPES)
+        self.entries = RollingCounts((zone_count, type_count), window_s, slices)
+        self.crossings = RollingCounts((len(self.line_names), 2, type_count), window_s, slices)
+        self.dwell = RollingCounts((zone_count, type_count, self.DWELL_BINS.size), window_s, slices)
+        # the last zone index stands for the whole scene
+        self.speed = RollingCounts((zone_count + 1, type_count, self.SPEED_BINS.size), window_s, slices)
+        self.occupancy = np.zeros((zone_count, type_count), dtype=np.int64)
+        # per object state of the previous tick, sorted by ID
+        self._ids = np.empty(0, dtype=np.int64)
+        self._types = np.empty(0, dtype=np.int64)
+        self._location = np.empty((0, 2))
+        self._entered = np.empty((0, zone_count))
+        self.updated_at: Optional[float] = None
+
+    def _inside(self, location: np.ndarray) -> np.ndarray:
+        inside = np.zeros((len(location), len(self.zones)), dtype=bool)
+        for z, (zone, (lo, hi)) in enumerate(zip(self.zones, self._zone_bboxes)):
+            rows = np.flatnonzero(((location >= lo) & (location <= hi)).all(axis=1))
+            inside[rows, z] = points_in_polygon(location[rows], zone)
+        return inside
+
+    def _count_crossings(self, before: np.ndarray, after: np.ndarray, types: np.ndarray):
+        if not len(self.line_names) or not len(before):
+            return
+        # (objects, lines) sides of the line before and after the move
+        lx, ly = self._line_dir[:, 0], self._line_dir[:, 1]
+        side_before = _cross(lx, ly, before[:, :1] - self._line_start[:, 0], before[:, 1:] - self._line_start[:, 1])
+        side_after = _cross(lx, ly, after[:, :1] - self._line_start[:, 0], after[:, 1:] - self._line_start[:, 1])
+        # the line's end points must lie on opposite sides of the move
+        mx, my = (after - before)[:, :1], (after - before)[:, 1:]
+        to_start_x, to_start_y = self._line_start[:, 0] - before[:, :1], self._line_start[:, 1] - before[:, 1:]
+        ends = (_cross(mx, my, to_start_x, to_start_y)
+                * _cross(mx, my, to_start_x + lx, to_start_y + ly)) <= 0
+        forward = (side_before <= 0) & (side_after > 0) & ends
+        backward = (side_before > 0) & (side_after <= 0) & ends
+        for direction, crossed in enumerate((forward, backward)):
+            rows, lines = np.nonzero(crossed)
+            if len(rows):
+                self.crossings.add((lines, np.full(len(rows), direction), types[rows]))
+
+    def update(self, frame: TrackedFrame, t: Optional[float] = None):
+        """Fold in the objects tracked at UNIX time `t` (default now). `frame` must
+        hold every tracked object, like `VehicleTracker.current_vehicles`, so objects
+        missing from it are treated as gone.
+        """
+        t = time.time() if t is None else t
+        self.updated_at = t
+        for counts in (self.entries, self.crossings, self.dwell, self.speed):
+            counts.advance(t)
+        if len(frame) > 1 and (frame.ids[1:] < frame.ids[:-1]).any():
+            frame = frame.take(np.argsort(frame.ids, kind='stable'))
+        ids = frame.ids
+        types = _TYPE_INDEX[frame.obj_type]
+        location = frame.location.astype(np.float64)
+
+        if len(self._ids):
+            previous = np.minimum(np.searchsorted(self._ids, ids), len(self._ids) - 1)
+            known = self._ids[previous] == ids
+            gone = np.ones(len(self._ids), dtype=bool)
+            gone[previous[known]] = False
+        else:
+            previous = np.zeros(len(ids), dtype=np.int64)
+            known = np.zeros(len(ids), dtype=bool)
+            gone = np.zeros(0, dtype=bool)
+
+        entered = np.full((len(ids), len(self.zones)), np.nan)
+        entered[known] = self._entered[previous[known]]
+        was_inside = ~np.isnan(entered)
+        # objects whose record did not change since the last tick cannot have entered, left or crossed anything
+        moved = ~known
+        moved[known] = (location[known] != self._location[previous[known]]).any(axis=1)
+        inside = was_inside.copy()
+        inside[moved] = self._inside(location[moved])
+
+        rows, zones = np.nonzero(inside & ~was_inside)
+        entered[rows, zones] = t
+        if len(rows):
+            self.entries.add((zones, types[rows]))
+
+        rows, zones = np.nonzero(was_inside & ~inside)
+        gone_rows, gone_zones = np.nonzero(~np.isnan(self._entered[gone]))
+        dwell_zones = np.concatenate((zones, gone_zones))
+        if len(dwell_zones):
+            dwell_types = np.concatenate((types[rows], self._types[gone][gone_rows]))
+            dwell_s = t - np.concatenate((entered[rows, zones], self._entered[gone][gone_rows, gone_zones]))
+            self.dwell.add((dwell_zones, dwell_types, self.DWELL_BINS.index(dwell_s)))
+        entered[~inside] = np.nan
+
+        moved_known = moved & known
+        self._count_crossings(self._location[previous[moved_known]], location[moved_known], types[moved_known])
+
+        zone_count = len(self.zones)
+        rows, zones = np.nonzero(inside)
+        self.occupancy = np.bincount(zones * len(OBJECT_TYPES) + types[rows],
+                                     minlength=self.occupancy.size).reshape(self.occupancy.shape)
+        speed_bins = self.SPEED_BINS.index(np.hypot(frame.vel[:, 0], frame.vel[:, 1]))
+        self.speed.add((np.concatenate((np.full(len(ids), zone_count), zones)),
+                        np.concatenate((types, types[rows])), np.concatenate((speed_bins, speed_bins[rows]))))
+
+        self._ids, self._types, self._location, self._entered = ids, types, location, entered
+
+    @staticmethod
+    def _by_type(counts: np.ndarray) -> Dict[str, int]:
+        return {OBJECT_TYPES[i].name.lower(): int(counts[i]) for i in np.flatnonzero(counts)}
+
+    @staticmethod
+    def _distributions(counts: np.ndarray, bins: LogBins) -> Dict[str, dict]:
+        totals = counts.sum(axis=-1)
+        quantiles = bins.quantiles(counts)
+        return {
+            OBJECT_TYPES[i].name.lower(): {"count": int(totals[i]),
+                                           **{f"p{round(q * 100)}": float(v) for q, v in zip(QUANTILES, quantiles[i])}}
+            for i in np.flatnonzero(totals)
+        }
+
+    def snapshot(self) -> dict:
+        """Return the current statistics, JSON-ready, leaving out types without any data.
+        """
+        entries, crossings, dwell, speed = (self.entries.total(), self.crossings.total(), self.dwell.total(),
+                                            self.speed.total())
+        return {
+            "time": self.updated_at,
+            "windowS": self.window_s,
+            "speed": self._distributions(speed[-1], self.SPEED_BINS),
+            "zones": {
+                name: {"occupancy": self._by_type(self.occupancy[z]), "entries": self._by_type(entries[z]),
+                       "dwellS": self._distributions(dwell[z], self.DWELL_BINS),
+                       "speed": self._distributions(speed[z], self.SPEED_BINS)}
+                for z, name in enumerate(self.zone_names)
+            },
+            "lines": {
+                name: {"forward": self._by_type(crossings[i, 0]), "backward": self._by_type(crossings[i, 1])}
+                for i, name in enumerate(self.line_names)
+            },
+        }
@@ -0,0 +1,193 @@
+"""
+Benchmarks for the backend tick pipeline.
+
+Stage timings run each step of the pipeline in isolation on simulated packets.
+The end-to-end run connects a real :class:`~.VehicleTracker` to a local
+:class:`~.SimulatorServer` over TCP and broadcasts to simulated websocket
+clients. Run e.g.:
+
+    python benchmark.py --objects 100 1000 5000 --clients 1 50 200
+"""
+import argparse
+import asyncio
+import gc
+import json
+import resource
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from history import VehicleHistory
+from projection import CameraProjection
+from server import ClientSender, Room, TrackingUpdate, VehicleTracker
+from simulator import SimulatorServer, SimulatorSource, TrafficSimulator
+from tracking import TrackedFrame
+
+BENCH_PORT = 7787
+# a typical 1080p lens correction, for timing the projection of pixel coordinate feeds
+BENCH_PROJECTION = CameraProjection(np.eye(3), camera_matrix=[[1000, 0, 960], [0, 1000, 540], [0, 0, 1]],
+                                    dist_coeffs=[-0.2, 0.05, 0, 0, 0], frame_size=(1920, 1080))
+
+
+class BenchWebSocket:
+    """Stand-in for a starlette websocket that counts what is sent, optionally taking `send_delay_s` per message.
+    """
+
+    def __init__(self, send_delay_s: float = 0.0):
+        self.send_delay_s = send_delay_s
+        self.messages = 0
+        self.bytes = 0
+
+    async def _send(self, size: int):
+        if self.send_delay_s:
+            await asyncio.sleep(self.send_delay_s)
+        self.messages += 1
+        self.bytes += size
+
+    async def send_text(self, text: str):
+        await self._send(len(text))
+
+    async def send_bytes(self, data: bytes):
+        await self._send(len(data))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def _time_ms(func: Callable[[], object], repeat: int) -> float:
+    """Median wall time of `func` in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def _rss_mb() -> float:
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * resource.getpagesize() / 1024 / 1024
+
+
+def bench_stages(object_count: int, repeat: int = 50) -> Dict[str, float]:
+    simulator = TrafficSimulator(object_count, seed=0)
+    packets = [simulator.step(0.02).copy() for _ in range(repeat + 1)]
+    frames = [TrackedFrame.from_np(packet) for packet in packets]
+
+    packet_iter = iter(packets)
+    decode = _time_ms(lambda: TrackedFrame.from_np(next(packet_iter)), repeat)
+
+    history = VehicleHistory()
+    frame_iter = iter(frames)
+
+    def update_history():
+        frame = next(frame_iter)
+        history.append(frame)
+        history.evict_older_than(frame.timestamp[0] - VehicleTracker.VEHICLE_TIMEOUT_S)
+        history.snapshot()
+
+    history_ms = _time_ms(update_history, repeat)
+
+    snapshot = history.snapshot()
+    previous = frames[-2]
+    thresholds = Room().delta_thresholds
+    packet_iter = iter(packets)
+    project = _time_ms(lambda: BENCH_PROJECTION.project_records(next(packet_iter)), repeat)
+    return {
+        'decode_ms': decode,
+        'project_ms': project,
+        'history_ms': history_ms,
+        'json_ms': _time_ms(lambda: TrackingUpdate(snapshot, 0.02, False, thresholds).encode(False), repeat),
+        'binary_ms': _time_ms(lambda: TrackingUpdate(snapshot, 0.02, False, thresholds).encode(True), repeat),
+        'delta_json_ms': _time_ms(
+            lambda: TrackingUpdate(snapshot, 0.02, False, thresholds).encode(False, previous), repeat),
+    }
+
+
+async def bench_end_to_end(object_count: int, client_count: int, duration_s: float, rate_hz: float,
+                           binary: bool = False, delta: bool = False, slow_clients: int = 0,
+                           slow_send_delay_s: float = 0.1) -> Dict[str, float]:
+    server = SimulatorServer(SimulatorSource(TrafficSimulator(object_count, seed=0), rate_hz=rate_hz))
+    await server.start('127.0.0.1', BENCH_PORT)
+    room = Room()
+    senders: List[ClientSender] = []
+    websockets: List[BenchWebSocket] = []
+    for i in range(client_count):
+        websocket = BenchWebSocket(slow_send_delay_s if i < slow_clients else 0.0)
+        websockets.append(websocket)
+        sender = ClientSender(websocket, binary=binary, delta=delta)
+        sender.start()
+        room.add_user(f"bench_{i}", sender)
+        senders.append(sender)
+
+    tracker = VehicleTracker(room, broadcast_delay_s=0)
+    await tracker.connect('127.0.0.1', BENCH_PORT)
+    gc.collect()
+    rss_before = _rss_mb()
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    listen_task = asyncio.ensure_future(tracker.listen())
+    await asyncio.sleep(duration_s)
+    listen_task.cancel()
+    cpu_s, wall_s = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    rss_after = _rss_mb()
+    for sender in senders:
+        await sender.stop()
+    await tracker.close()
+    server.close()
+
+    fast = senders[slow_clients:] or senders
+    sent = sum(s.sent_frames for s in fast)
+    return {
+        'frames_per_s': sent / len(fast) / wall_s,
+        'broadcasts': tracker.delay_line.released,
+        'latency_mean_ms': (sum(s.latency_sum_s for s in fast) / sent * 1000) if sent else float('nan'),
+        'latency_max_ms': max(s.latency_max_s for s in fast) * 1000,
+        'dropped_frames': sum(s.dropped_frames for s in senders),
+        'bytes_per_client_s': sum(w.bytes for w in websockets) / len(websockets) / wall_s,
+        'cpu_percent': cpu_s / wall_s * 100,
+        'rss_mb': rss_after,
+        'rss_growth_mb': rss_after - rss_before,
+    }
+
+
+def _print_table(title: str, rows: List[Dict[str, float]]):
+    print(f"\n{title}")
+    columns = list(rows[0])
+    print("  ".join(f"{c:>16}" for c in columns))
+    for row in rows:
+        print("  ".join(f"{row[c]:>16.3f}" if isinstance(row[c], float) else f"{row[c]:>16}" for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend tick pipeline.")
+    parser.add_argument('--objects', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 50, 200])
+    parser.add_argument('--duration', type=float, default=3.0, help="seconds per end-to-end run")
+    parser.add_argument('--rate', type=float, default=50.0, help="tracker packets per second")
+    parser.add_argument('--binary', action='store_true', help="clients use the binary encoding")
+    parser.add_argument('--delta', action='store_true', help="clients use delta updates")
+    parser.add_argument('--slow-clients', type=int, default=0, help="clients taking 100 ms per send")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    stages = [{'objects': n, **bench_stages(n)} for n in args.objects]
+    loop = asyncio.get_event_loop()
+    end_to_end = [
+        {'objects': n, 'clients': c, **loop.run_until_complete(
+            bench_end_to_end(n, c, args.duration, args.rate, binary=args.binary, delta=args.delta,
+                             slow_clients=min(args.slow_clients, c)))}
+        for n in args.objects for c in args.clients
+    ]
+    if args.json:
+        print(json.dumps({'stages': stages, 'end_to_end': end_to_end}, indent=2))
+    else:
+        _print_table("Stage timings (median per tick)", stages)
+        _print_table("End to end", end_to_end)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""
+Pub-sub backends carrying tracking frames from the ingest side to the rooms that
+fan them out to websocket clients.
+
+Messages are opaque bytes on named channels. :class:`MemoryBroadcast` connects
+publishers and subscribers within one process; :class:`SocketBroadcast` lets a
+single ingest process publish to any number of uvicorn workers (or hosts) over
+TCP, with the publishing side acting as the hub so no external service is
+needed. Subscribers only ever need the latest frame, so every queue is bounded
+and drops its oldest message rather than blocking the publisher.
+"""
+import asyncio
+import collections
+import logging
+import struct
+from typing import Deque, Dict, Optional, Protocol, Set, Tuple
+from urllib.parse import urlparse
+
+from metrics import metrics
+from tracking import TrackedFrame
+
+logger = logging.getLogger(__name__)
+
+TRACKING_TIME = struct.Struct('<d')
+# op, channel length, payload length; followed by the channel name and the payload
+WIRE_HEADER = struct.Struct('<BHI')
+OP_SUBSCRIBE = 1
+OP_UNSUBSCRIBE = 2
+OP_PUBLISH = 3
+
+
+def tracking_channel(camera: str) -> str:
+    return f"tracking.{camera}"
+
+
+def status_channel(camera: str) -> str:
+    return f"status.{camera}"
+
+
+def analytics_channel(camera: str) -> str:
+    return f"analytics.{camera}"
+
+
+def encode_tracking(frame: TrackedFrame, tick_time: float) -> bytes:
+    return TRACKING_TIME.pack(tick_time) + frame.to_buffer()
+
+
+def decode_tracking(message: bytes) -> Tuple[TrackedFrame, float]:
+    """Inverse of :func:`encode_tracking`.
+    Raises:
+        ValueError: If the message is malformed.
+    """
+    if len(message) < TRACKING_TIME.size:
+        raise ValueError("Truncated tracking message")
+    (tick_time,) = TRACKING_TIME.unpack_from(message)
+    return TrackedFrame.from_buffer(memoryview(message)[TRACKING_TIME.size:]), tick_time
+
+
+class Subscription:
+    """
+    Bounded queue of messages published on one channel, consumed with `async for`.
+    When full, the oldest message is dropped.
+    """
+
+    def __init__(self, channel: str, max_messages: int = 16):
+        self.channel = channel
+        self.dropped = 0
+        self._messages: Deque[bytes] = collections.deque(maxlen=max_messages)
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def put(self, message: bytes):
+        if len(self._messages) == self._messages.maxlen:
+            self.dropped += 1
+            metrics.inc('broadcast_dropped_messages_total', channel=self.channel)
+        self._messages.append(message)
+        self._ready.set()
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
+
+    def __aiter__(self) -> 'Subscription':
+        return self
+
+    async def __anext__(self) -> bytes:
+        while not self._messages:
+            if self._closed:
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        return self._messages.popleft()
+
+
+class BroadcastBackend(Protocol):
+    """Carries messages from publishers to every subscription on the same channel.
+    """
+
+    async def connect(self):
+        ...
+
+    async def disconnect(self):
+        ...
+
+    async def publish(self, channel: str, message: bytes):
+        ...
+
+    def subscribe(self, channel: str) -> Subscription:
+        ...
+
+    def unsubscribe(self, subscription: Subscription):
+        ...
+
+
+class MemoryBroadcast:
+    """
+    In-process backend, for running ingest and websocket fan-out in one process.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[Subscription]] = collections.defaultdict(set)
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.close()
+        self._subscriptions.clear()
+
+    async def publish(self, channel: str, message: bytes):
+        self.deliver(channel, message)
+
+    def deliver(self, channel: str, message: bytes):
+        for subscription in self._subscriptions.get(channel, ()):
+            subscription.put(message)
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(channel)
+        self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions[subscription.channel].discard(subscription)
+        subscription.close()
+
+    @property
+    def channels(self) -> Set[str]:
+        return {channel for channel, subscriptions in self._subscriptions.items() if subscriptions}
+
+
+def _pack(op: int, channel: str, payload: bytes = b'') -> bytes:
+    name = channel.encode()
+    return WIRE_HEADER.pack(op, len(name), len(payload)) + name + payload
+
+
+async def _read_message(reader: asyncio.StreamReader) -> Tuple[int, str, bytes]:
+    op, name_size, payload_size = WIRE_HEADER.unpack(await reader.readexactly(WIRE_HEADER.size))
+    name = await reader.readexactly(name_size)
+    return op, name.decode(), await reader.readexactly(payload_size)
+
+
+class SocketBroadcast(MemoryBroadcast):
+    """
+    TCP backend for spreading websocket clients over several processes or hosts.
+    The hub (`serve=True`, normally the ingest process) listens on `host:port` and
+    forwards every message published on it, or by a connected peer, to the local
+    subscriptions and to every peer subscribed to the channel. Peers reconnect
+    with backoff and resubscribe if the hub goes away. Peers whose socket backs up
+    beyond `max_buffered_bytes` miss messages instead of slowing the hub down.
+    """
+    RECONNECT_BACKOFF_S = 0.5
+    MAX_RECONNECT_BACKOFF_S = 10.0
+
+    def __init__(self, host: str, port: int, serve: bool = False, max_buffered_bytes: int = 8 * 1024 * 1024):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.serve = serve
+        self.max_buffered_bytes = max_buffered_bytes
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Dict[asyncio.StreamWriter, Set[str]] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        if self.serve:
+            self._server = await asyncio.start_server(self._on_peer, self.host, self.port)
+        else:
+            self._task = asyncio.ensure_future(self._run_peer())
+
+    async def disconnect(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._peers):
+            writer.close()
+        if self._writer is not None:
+            self._writer.close()
+        await super().disconnect()
+
+    async def publish(self, channel: str, message: bytes):
+        if self.serve:
+            self._forward(channel, message)
+        elif self._writer is not None and not self._writer.is_closing():
+            self._writer.write(_pack(OP_PUBLISH, channel, message))
+
+    def subscribe(self, channel: str) -> Subscription:
+        new_channel = channel not in self.channels
+        subscription = super().subscribe(channel)
+        if new_channel and self._writer is not None:
+            self._writer.write(_pack(OP_SUBSCRIBE, channel))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        super().unsubscribe(subscription)
+        if subscription.channel not in self.channels and self._writer is not None:
+            self._writer.write(_pack(OP_UNSUBSCRIBE, subscription.channel))
+
+    def _forward(self, channel: str, message: bytes):
+        self.deliver(channel, message)
+        packed = None
+        for writer, channels in self._peers.items():
+            if channel not in channels or writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() > self.max_buffered_bytes:
+                metrics.inc('broadcast_dropped_messages_total', channel=channel)
+                continue
+            if packed is None:
+                packed = _pack(OP_PUBLISH, channel, message)
+            writer.write(packed)
+
+    async def _on_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channels: Set[str] = set()
+        self._peers[writer] = channels
+        try:
+            while True:
+                op, channel, payload = await _read_message(reader)
+                if op == OP_SUBSCRIBE:
+                    channels.add(channel)
+                elif op == OP_UNSUBSCRIBE:
+                    channels.discard(channel)
+                elif op == OP_PUBLISH:
+                    self._forward(channel, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._peers[writer]
+            writer.close()
+
+    async def _run_peer(self):
+        failures = 0
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                logger.info("Connected to broadcast hub %s:%d", self.host, self.port)
+                failures = 0
+                for channel in self.channels:
+                    self._writer.write(_pack(OP_SUBSCRIBE, channel))
+                while True:
+                    op, channel, payload = await _read_message(reader)
+                    if op == OP_PUBLISH:
+                        self.deliver(channel, payload)
+            except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+                logger.warning("Broadcast hub %s:%d unavailable (%r)", self.host, self.port, e)
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            await asyncio.sleep(min(self.RECONNECT_BACKOFF_S * 2 ** failures, self.MAX_RECONNECT_BACKOFF_S))
+            failures += 1
+
+
+def create_backend(url: str, serve: bool = False) -> BroadcastBackend:
+    """Create the backend for a `memory://` or `tcp://host:port` URL. The TCP
+    backend acts as the hub if `serve` is set.
+    Raises:
+        ValueError: If the URL scheme is not supported.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == 'memory':
+        return MemoryBroadcast()
+    if parsed.scheme == 'tcp':
+        return SocketBroadcast(parsed.hostname or '127.0.0.1', parsed.port or 7800, serve=serve)
+    raise ValueError(f"Unsupported broadcast backend {url}")
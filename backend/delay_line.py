@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DelayLine:
+    """
+    Fixed-capacity ring buffer of timestamped items, released in order by a single
+    scheduler coroutine once `delay_s` has elapsed since each item was pushed.
+    If the buffer is full the oldest item is dropped, so memory stays bounded.
+    """
+
+    def __init__(self, delay_s: float, release: Callable[[Any], Awaitable[None]], capacity: int = 512):
+        self.delay_s = delay_s
+        self.capacity = capacity
+        self._release = release
+        self._items: List[Any] = [None] * capacity
+        self._due: List[float] = [0.0] * capacity
+        self._head = 0
+        self._count = 0
+        self._pushed: Optional[asyncio.Event] = None
+        self.released = 0
+        self.overflowed = 0
+        self.max_lateness_s = 0.0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def push(self, item: Any):
+        """Schedule `item` for release after `delay_s`.
+        """
+        if self._count == self.capacity:
+            self._pop()
+            self.overflowed += 1
+        tail = (self._head + self._count) % self.capacity
+        self._items[tail] = item
+        self._due[tail] = asyncio.get_event_loop().time() + self.delay_s
+        self._count += 1
+        if self._pushed is not None:
+            self._pushed.set()
+
+    def _pop(self) -> Any:
+        item = self._items[self._head]
+        self._items[self._head] = None
+        self._head = (self._head + 1) % self.capacity
+        self._count -= 1
+        return item
+
+    async def run(self):
+        """Release items as they become due. Runs until cancelled.
+        """
+        loop = asyncio.get_event_loop()
+        self._pushed = asyncio.Event()
+        while True:
+            if not self._count:
+                self._pushed.clear()
+                await self._pushed.wait()
+                continue
+            wait = self._due[self._head] - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            self.max_lateness_s = max(self.max_lateness_s, -wait)
+            item = self._pop()
+            self.released += 1
+            try:
+                await self._release(item)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to release delayed item")
@@ -0,0 +1,78 @@
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional
+
+DEFAULT_HOST = '14.137.209.102'
+DEFAULT_PORT = 7777
+DEFAULT_FEED = 'default'
+
+
+@dataclass
+class FeedConfig:
+    """
+    One tracker feed, served to websocket clients on `/stream/<name>`.
+    A feed with `replay` set plays back that recording (see `recording.py`) in
+    a loop instead of connecting to `host:port`.
+    `zones` (polygons as flat x,y lists) and `lines` (x0,y0,x1,y1), in map
+    coordinates, are the named areas and counting lines of the feed's analytics
+    (see `analytics.py`), aggregated over `analytics_window_s`.
+    With `pixel_coordinates` set, the tracker reports camera pixels, which are
+    projected onto the map with the camera's calibration (see `projection.py`).
+    Objects are broadcast extrapolated `prediction_lead_s` seconds ahead along
+    their trajectory fits, and held back that much less than `broadcast_delay_s`.
+    With `output_rate_hz` set, the latest frame is re-broadcast at that rate,
+    extrapolated to each send time (see `prediction.py`).
+    """
+    name: str
+    host: str = DEFAULT_HOST
+    port: int = DEFAULT_PORT
+    length_prefixed: bool = False
+    broadcast_delay_s: float = 3.3
+    replay: Optional[str] = None
+    replay_speed: float = 1.0
+    record: Optional[str] = None
+    zones: Dict[str, List[float]] = field(default_factory=dict)
+    lines: Dict[str, List[float]] = field(default_factory=dict)
+    analytics_window_s: float = 300.0
+    pixel_coordinates: bool = False
+    prediction_lead_s: float = 0.0
+    output_rate_hz: Optional[float] = None
+
+    def __post_init__(self):
+        if self.broadcast_delay_s < 0:
+            raise ValueError("`broadcast_delay_s` must not be negative")
+        if not 0 <= self.prediction_lead_s <= self.broadcast_delay_s:
+            raise ValueError("`prediction_lead_s` must be between 0 and `broadcast_delay_s`")
+        if self.output_rate_hz is not None and self.output_rate_hz <= 0:
+            raise ValueError("`output_rate_hz` must be a positive number")
+
+
+def load_feeds(path: str) -> List[FeedConfig]:
+    """Load feeds from a JSON object mapping each camera name to its settings, e.g.
+    `{"pub": {"host": "10.0.0.2", "port": 7777}, "square": {"replay": "recordings/square"}}`.
+    Raises:
+        ValueError: If the file holds no feeds or a feed has unknown or invalid settings.
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    feeds = []
+    for name, entry in entries.items():
+        try:
+            feeds.append(FeedConfig(name=name, **entry))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid settings for feed {name!r}: {e}") from None
+    if not feeds:
+        raise ValueError(f"No feeds configured in {path}")
+    return feeds
+
+
+def feeds_from_env(environ: Mapping[str, str] = os.environ) -> List[FeedConfig]:
+    """Load the feeds named by `TRACKER_FEEDS`, or a single default feed configured by
+    `TRACKER_REPLAY`, `TRACKER_REPLAY_SPEED` and `TRACKER_RECORD`.
+    """
+    if path := environ.get('TRACKER_FEEDS'):
+        return load_feeds(path)
+    return [FeedConfig(DEFAULT_FEED, replay=environ.get('TRACKER_REPLAY'),
+                       replay_speed=float(environ.get('TRACKER_REPLAY_SPEED', 1.0)),
+                       record=environ.get('TRACKER_RECORD'))]
@@ -0,0 +1,108 @@
+import asyncio
+import struct
+from typing import Optional, Protocol
+
+import numpy as np
+
+from tracking import TrackedObject
+
+RECORD_DTYPE = np.dtype('<f4')
+RECORD_SIZE = TrackedObject.NP_ARRAY_SIZE * RECORD_DTYPE.itemsize
+LENGTH_HEADER = struct.Struct('<I')
+
+
+class FrameSource(Protocol):
+    """Anything :class:`~.VehicleTracker` can read raw `(N, 13)` record frames from.
+    """
+
+    async def read_frame(self) -> np.ndarray:
+        ...
+
+
+class FrameReader:
+    """
+    Reassembles tracker records from a byte stream.
+    Bytes are accumulated in a reusable buffer, so records split across TCP
+    segments are never lost or misaligned. In the default mode every call emits
+    all complete 13-float records received so far; in length-prefixed mode each
+    frame is preceded by a little-endian uint32 holding its payload size in bytes.
+    Emitted arrays are views into the internal buffer and are only valid until the
+    next call to :meth:`feed` or :meth:`read_frame`.
+    """
+
+    def __init__(self, reader: Optional[asyncio.StreamReader] = None, length_prefixed: bool = False,
+                 chunk_size: int = 65536, max_frame_bytes: int = 16 * 1024 * 1024):
+        self._reader = reader
+        self.length_prefixed = length_prefixed
+        self.chunk_size = chunk_size
+        self.max_frame_bytes = max_frame_bytes
+        self._buffer = bytearray(max(chunk_size, RECORD_SIZE) * 4)
+        self._start = 0
+        self._end = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes not yet emitted as part of a frame.
+        """
+        return self._end - self._start
+
+    def feed(self, data: bytes):
+        """Append received bytes to the buffer, compacting or growing it as required.
+        """
+        size = len(data)
+        if self._end + size > len(self._buffer):
+            pending = self.pending
+            if pending + size > len(self._buffer):
+                # grow into a new buffer, leaving previously emitted views untouched
+                new_buffer = bytearray(max(2 * len(self._buffer), pending + size))
+                new_buffer[:pending] = self._buffer[self._start:self._end]
+                self._buffer = new_buffer
+            else:
+                self._buffer[:pending] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, pending
+        self._buffer[self._end:self._end + size] = data
+        self._end += size
+
+    def next_frame(self) -> Optional[np.ndarray]:
+        """Return the next complete frame as an `(N, 13)` float32 array, or `None` if
+        more data is needed.
+        Raises:
+            ConnectionError: If a length-prefixed header describes an invalid frame. The
+                stream cannot be resynchronised after this, so the connection must be reopened.
+        """
+        if self.length_prefixed:
+            if self.pending < LENGTH_HEADER.size:
+                return None
+            (length,) = LENGTH_HEADER.unpack_from(self._buffer, self._start)
+            if length % RECORD_SIZE or length > self.max_frame_bytes:
+                raise ConnectionError(f"Invalid frame length {length}")
+            if self.pending < LENGTH_HEADER.size + length:
+                return None
+            offset = self._start + LENGTH_HEADER.size
+            self._start = offset + length
+        else:
+            length = (self.pending // RECORD_SIZE) * RECORD_SIZE
+            if not length:
+                return None
+            offset = self._start
+            self._start += length
+        if self._start == self._end:
+            self._start = self._end = 0
+        count = length // RECORD_DTYPE.itemsize
+        return np.frombuffer(self._buffer, dtype=RECORD_DTYPE, count=count, offset=offset).reshape(
+            (count // TrackedObject.NP_ARRAY_SIZE, TrackedObject.NP_ARRAY_SIZE))
+
+    async def read_frame(self) -> np.ndarray:
+        """Read from the stream until a complete frame is available.
+        Raises:
+            ConnectionResetError: If the stream reaches EOF.
+            ConnectionError: If a length-prefixed header describes an invalid frame.
+        """
+        while True:
+            frame = self.next_frame()
+            if frame is not None:
+                return frame
+            data = await self._reader.read(self.chunk_size)
+            if not data:
+                raise ConnectionResetError("Tracker closed the connection")
+            self.feed(data)
@@ -0,0 +1,132 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from tracking import TrackedFrame
+
+# column name -> (per point shape, dtype), matching the columns of TrackedFrame
+_COLUMNS: Dict[str, Tuple[Tuple[int, ...], type]] = {
+    'location': ((2,), np.int64),
+    'rotation': ((), np.float64),
+    'vel': ((2,), np.float64),
+    'obj_type': ((), np.int64),
+    'x_coeffs': ((3,), np.float64),
+    'y_coeffs': ((3,), np.float64),
+    'timestamp': ((), np.float64),
+}
+
+
+class VehicleHistory:
+    """
+    Preallocated ring buffers holding the last `depth` points of every tracked vehicle.
+    Vehicle IDs are mapped to dense slots; a whole frame is appended, and expired
+    vehicles evicted, with a handful of vectorised NumPy operations regardless of
+    the number of vehicles. Storage doubles when all slots are in use.
+    """
+
+    def __init__(self, depth: int = 3, capacity: int = 256):
+        if depth < 1:
+            raise ValueError("History depth must be at least 1")
+        self.depth = depth
+        self._capacity = 0
+        self._columns: Dict[str, np.ndarray] = {}
+        self._head = np.empty(0, dtype=np.int64)
+        self._length = np.empty(0, dtype=np.int64)
+        self._free = np.empty(0, dtype=np.int64)
+        # active vehicle IDs sorted ascending, and the slot each one occupies
+        self._ids = np.empty(0, dtype=np.int64)
+        self._slots = np.empty(0, dtype=np.int64)
+        self._snapshot: Optional[TrackedFrame] = None
+        self._grow(capacity)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, obj_id: int) -> bool:
+        return self._find(np.array([obj_id], dtype=np.int64))[0] >= 0
+
+    def _grow(self, capacity: int):
+        old_capacity = self._capacity
+        for name, (shape, dtype) in _COLUMNS.items():
+            column = np.zeros((capacity, self.depth) + shape, dtype=dtype)
+            if old_capacity:
+                column[:old_capacity] = self._columns[name]
+            self._columns[name] = column
+        self._head = np.concatenate((self._head, np.zeros(capacity - old_capacity, dtype=np.int64)))
+        self._length = np.concatenate((self._length, np.zeros(capacity - old_capacity, dtype=np.int64)))
+        self._free = np.concatenate((self._free, np.arange(old_capacity, capacity, dtype=np.int64)))
+        self._capacity = capacity
+
+    def _find(self, ids: np.ndarray) -> np.ndarray:
+        """Return the slot of every ID, or -1 for IDs that are not tracked.
+        """
+        if not len(self._ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._ids, ids), len(self._ids) - 1)
+        return np.where(self._ids[pos] == ids, self._slots[pos], -1)
+
+    def append(self, frame: TrackedFrame):
+        """Append the latest point of every vehicle in `frame` (IDs must be unique).
+        """
+        if not len(frame):
+            return
+        slots = self._find(frame.ids)
+        new = slots < 0
+        new_count = int(new.sum())
+        if new_count:
+            if new_count > len(self._free):
+                self._grow(max(2 * self._capacity, len(self._ids) + new_count))
+            allocated, self._free = self._free[:new_count], self._free[new_count:]
+            slots[new] = allocated
+            self._head[allocated] = self.depth - 1
+            self._length[allocated] = 0
+            ids = np.concatenate((self._ids, frame.ids[new]))
+            all_slots = np.concatenate((self._slots, allocated))
+            order = np.argsort(ids, kind='stable')
+            self._ids, self._slots = ids[order], all_slots[order]
+
+        head = (self._head[slots] + 1) % self.depth
+        self._head[slots] = head
+        self._length[slots] = np.minimum(self._length[slots] + 1, self.depth)
+        for name, column in self._columns.items():
+            column[slots, head] = getattr(frame, name)
+        self._snapshot = None
+
+    def evict_older_than(self, timestamp: float) -> np.ndarray:
+        """Drop every vehicle whose latest point is older than `timestamp`, returning their IDs.
+        """
+        if not len(self._ids):
+            return self._ids
+        latest = self._columns['timestamp'][self._slots, self._head[self._slots]]
+        expired = latest < timestamp
+        if not expired.any():
+            return self._ids[:0]
+        evicted = self._ids[expired]
+        self._free = np.concatenate((self._free, self._slots[expired]))
+        self._ids, self._slots = self._ids[~expired], self._slots[~expired]
+        self._snapshot = None
+        return evicted
+
+    def snapshot(self) -> TrackedFrame:
+        """Return the latest point of every vehicle. The frame is cached until the next change.
+        """
+        if self._snapshot is None:
+            heads = self._head[self._slots]
+            self._snapshot = TrackedFrame(ids=self._ids.copy(), **{
+                name: column[self._slots, heads] for name, column in self._columns.items()
+            })
+        return self._snapshot
+
+    def trail(self, obj_id: int) -> TrackedFrame:
+        """Return the stored points of one vehicle, oldest first.
+        Raises:
+            KeyError: If the vehicle is not tracked.
+        """
+        slot = int(self._find(np.array([obj_id], dtype=np.int64))[0])
+        if slot < 0:
+            raise KeyError(obj_id)
+        length = int(self._length[slot])
+        points = (self._head[slot] - np.arange(length - 1, -1, -1)) % self.depth
+        return TrackedFrame(ids=np.full(length, obj_id, dtype=np.int64), **{
+            name: column[slot, points] for name, column in self._columns.items()
+        })
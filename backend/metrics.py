@@ -0,0 +1,132 @@
+import bisect
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+# seconds, from 50 us to 1 s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Minimal registry of counters and timing histograms, rendered in the Prometheus
+    text format. Every recording method returns immediately when disabled, so
+    instrumentation can stay in the hot path.
+    Usage::
+
+        start = metrics.clock()
+        decode(...)
+        metrics.observe_since('tracker_decode_seconds', start)
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def clock(self) -> float:
+        return time.perf_counter() if self.enabled else 0.0
+
+    def observe_since(self, name: str, start: float, **labels: str):
+        if not self.enabled:
+            return
+        self.observe(name, time.perf_counter() - start, **labels)
+
+    def observe(self, name: str, value: float, **labels: str):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        """Add a callable returning `(name, labels, value)` samples at scrape time.
+        Samples named `*_total` are reported as counters, everything else as gauges.
+        """
+        self._collectors.append(collector)
+
+    def unregister_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.remove(collector)
+
+    def _header(self, lines: List[str], name: str, kind: str, seen: set):
+        if name in seen:
+            return
+        seen.add(name)
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self, samples: Iterable[Sample] = ()) -> str:
+        """Render all metrics, the registered collectors' samples and any extra `samples`.
+        """
+        lines: List[str] = []
+        seen: set = set()
+        for (name, labels), value in sorted(self._counters.items()):
+            self._header(lines, name, 'counter', seen)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+            self._header(lines, name, 'histogram', seen)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{_format_labels(labels, le)} {histogram.count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        # samples of the same metric must be adjacent
+        grouped: Dict[str, List[str]] = {}
+        for collector_samples in [samples] + [collector() for collector in self._collectors]:
+            for name, labels, value in collector_samples:
+                grouped.setdefault(name, []).append(
+                    f"{name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+        for name, samples_lines in grouped.items():
+            self._header(lines, name, 'counter' if name.endswith('_total') else 'gauge', seen)
+            lines.extend(samples_lines)
+        return '\n'.join(lines) + '\n'
+
+
+def _enabled_from_env(value: Optional[str]) -> bool:
+    return value is None or value.lower() not in ('0', 'false', 'no', 'off')
+
+
+metrics = Metrics(enabled=_enabled_from_env(os.environ.get('METRICS_ENABLED')))
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, Union
+
+import numpy as np
+
+from tracking import POS_SCALE, TrackedFrame
+
+logger = logging.getLogger(__name__)
+
+
+def predict(frame: TrackedFrame, horizon_s: Union[float, np.ndarray], max_horizon_s: float = 1.0) -> TrackedFrame:
+    """Extrapolate every object `horizon_s` seconds past its timestamp.
+    The tracker's quadratic fits give `x(t) = xa * t**2 + xb * t + xc` (likewise for
+    y) in tracker pixels, with `t` in seconds relative to the record. Objects are
+    moved by `x(horizon) - x(0)` so the fit only contributes its shape, and the
+    velocity is replaced by the derivative at the horizon. Objects without a fit
+    (all coefficients zero) are extrapolated linearly from their velocity. The
+    horizon is clipped to `max_horizon_s` as quadratic fits diverge quickly.
+    """
+    if not len(frame):
+        return frame
+    t = np.clip(np.broadcast_to(np.asarray(horizon_s, dtype=np.float64), frame.timestamp.shape), 0, max_horizon_s)
+    fitted = (frame.x_coeffs != 0).any(axis=1) | (frame.y_coeffs != 0).any(axis=1)
+
+    coeffs = np.stack((frame.x_coeffs, frame.y_coeffs), axis=1)  # (N, 2, 3)
+    poly_shift = (coeffs[:, :, 0] * (t * t)[:, None] + coeffs[:, :, 1] * t[:, None]) * POS_SCALE
+    poly_vel = (2 * coeffs[:, :, 0] * t[:, None] + coeffs[:, :, 1]) * POS_SCALE
+    linear_shift = frame.vel * t[:, None]
+
+    shift = np.where(fitted[:, None], poly_shift, linear_shift)
+    vel = np.where(fitted[:, None], poly_vel, frame.vel)
+    return TrackedFrame(ids=frame.ids, location=np.rint(frame.location + shift).astype(np.int64),
+                        rotation=frame.rotation, vel=vel, obj_type=frame.obj_type, x_coeffs=frame.x_coeffs,
+                        y_coeffs=frame.y_coeffs, timestamp=frame.timestamp + t)
+
+
+class PredictedStream:
+    """
+    Broadcasts frames extrapolated to the moment they are sent.
+    Every frame is predicted `lead_s` seconds ahead, so the broadcast delay can
+    be shortened by the same amount while staying in line with the video. If an
+    `output_rate_hz` is given, the latest frame is re-broadcast at that rate,
+    extrapolated to each send time, so motion stays smooth even when the tracker
+    sends fewer packets.
+    """
+
+    def __init__(self, broadcast: Callable[[TrackedFrame, float], Awaitable[None]],
+                 output_rate_hz: Optional[float] = None, lead_s: float = 0.0, max_horizon_s: float = 1.0):
+        self._broadcast = broadcast
+        self.output_rate_hz = output_rate_hz
+        self.lead_s = lead_s
+        self.max_horizon_s = max_horizon_s
+        self._latest: Optional[TrackedFrame] = None
+        self._latest_at = 0.0
+
+    def _predict(self, frame: TrackedFrame, horizon_s: float) -> TrackedFrame:
+        if not len(frame):
+            return frame
+        # objects missing from the latest packets have older records, so predict them further
+        age = frame.timestamp.max() - frame.timestamp
+        return predict(frame, horizon_s + age, self.max_horizon_s)
+
+    async def update(self, frame: TrackedFrame, tick_time: float):
+        """Accept a new frame; broadcast it straight away unless upsampling.
+        """
+        if self.output_rate_hz:
+            self._latest = frame
+            self._latest_at = asyncio.get_event_loop().time()
+        elif self.lead_s:
+            await self._broadcast(self._predict(frame, self.lead_s), tick_time)
+        else:
+            await self._broadcast(frame, tick_time)
+
+    async def run(self):
+        """Broadcast the latest frame at `output_rate_hz`. Runs until cancelled.
+        """
+        if not self.output_rate_hz:
+            return
+        loop = asyncio.get_event_loop()
+        interval = 1 / self.output_rate_hz
+        next_send = loop.time()
+        while True:
+            next_send = max(next_send + interval, loop.time() - interval)
+            if self._latest is not None:
+                horizon = self.lead_s + loop.time() - self._latest_at
+                try:
+                    await self._broadcast(self._predict(self._latest, horizon), interval)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Failed to broadcast predicted frame")
+            # schedule against absolute times so the output rate does not drift
+            await asyncio.sleep(max(0.0, next_send - loop.time()))
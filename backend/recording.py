@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+from framing import FrameReader, RECORD_DTYPE
+from tracking import TrackedObject
+
+logger = logging.getLogger(__name__)
+
+# A recording is a pair of append-only files next to each other:
+#   <path>.rows   every received record, as raw little-endian float32 rows of 13 values
+#   <path>.index  one entry per frame: arrival time (UNIX seconds), first row and row count
+ROWS_SUFFIX = '.rows'
+INDEX_SUFFIX = '.index'
+INDEX_DTYPE = np.dtype([('arrival', '<f8'), ('offset', '<i8'), ('count', '<i8')])
+
+
+class TrackerRecorder:
+    """
+    Appends raw tracker frames and their arrival times to a recording.
+    Existing recordings are extended, not overwritten.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rows = open(path + ROWS_SUFFIX, 'ab')
+        self._index = open(path + INDEX_SUFFIX, 'ab')
+        self._offset = self._rows.tell() // (TrackedObject.NP_ARRAY_SIZE * RECORD_DTYPE.itemsize)
+        self.frames = 0
+
+    def write(self, frame: np.ndarray, arrival: Optional[float] = None):
+        """Append an `(N, 13)` frame of raw records.
+        """
+        count = len(frame)
+        self._rows.write(np.ascontiguousarray(frame, dtype=RECORD_DTYPE).tobytes())
+        entry = np.array([(time.time() if arrival is None else arrival, self._offset, count)], dtype=INDEX_DTYPE)
+        self._index.write(entry.tobytes())
+        self._offset += count
+        self.frames += 1
+
+    def flush(self):
+        self._rows.flush()
+        self._index.flush()
+
+    def close(self):
+        self._rows.close()
+        self._index.close()
+
+
+class ReplaySource:
+    """
+    Plays a recording back as a frame source for :class:`~.VehicleTracker`.
+    Frames are released at their recorded pace scaled by `speed` (2.0 plays twice
+    as fast), or as fast as possible if `speed` is 0. Both files are memory
+    mapped, so hours of traffic can be replayed without loading them.
+    When looping, the record timestamps of every pass are shifted by `period_s`
+    per earlier pass, so they keep increasing and objects from the end of the
+    recording time out as usual.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        index = np.fromfile(path + INDEX_SUFFIX, dtype=INDEX_DTYPE)
+        row_count = os.path.getsize(path + ROWS_SUFFIX) // (TrackedObject.NP_ARRAY_SIZE * RECORD_DTYPE.itemsize)
+        # ignore a frame whose rows were not completely written
+        self._index = index[index['offset'] + index['count'] <= row_count]
+        self._rows = np.memmap(path + ROWS_SUFFIX, dtype=RECORD_DTYPE, mode='r',
+                               shape=(row_count, TrackedObject.NP_ARRAY_SIZE)) if row_count else \
+            np.empty((0, TrackedObject.NP_ARRAY_SIZE), dtype=RECORD_DTYPE)
+        self._position = 0
+        self._passes = 0
+        self._started_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def duration_s(self) -> float:
+        if not len(self._index):
+            return 0.0
+        return float(self._index['arrival'][-1] - self._index['arrival'][0])
+
+    @property
+    def period_s(self) -> float:
+        """Duration of one pass when looping, including a frame interval between passes.
+        """
+        if len(self._index) < 2:
+            return 1.0
+        return self.duration_s * len(self._index) / (len(self._index) - 1)
+
+    def frame(self, i: int) -> np.ndarray:
+        entry = self._index[i]
+        return self._rows[entry['offset']:entry['offset'] + entry['count']]
+
+    async def read_frame(self) -> np.ndarray:
+        """Return the next recorded frame once it is due.
+        Raises:
+            EOFError: When the recording is exhausted and not looping.
+        """
+        if self._position >= len(self._index):
+            if not self.loop or not len(self._index):
+                raise EOFError(f"End of recording {self.path}")
+            self._position = 0
+            self._passes += 1
+            self._started_at = None
+        loop = asyncio.get_event_loop()
+        if self._started_at is None:
+            self._started_at = loop.time()
+        if self.speed:
+            offset = (self._index['arrival'][self._position] - self._index['arrival'][0]) / self.speed
+            wait = self._started_at + offset - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        else:
+            await asyncio.sleep(0)
+        frame = self.frame(self._position)
+        self._position += 1
+        if self._passes:
+            frame = np.array(frame)
+            frame[:, 6] += self._passes * self.period_s
+        return frame
+
+
+async def record(host: str, port: int, path: str, length_prefixed: bool = False):
+    """Record a tracker feed until interrupted.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(bytes("", "utf-8"))
+    await writer.drain()
+    frames = FrameReader(reader, length_prefixed=length_prefixed)
+    recorder = TrackerRecorder(path)
+    try:
+        while True:
+            recorder.write(await frames.read_frame())
+            if recorder.frames % 500 == 0:
+                recorder.flush()
+                logger.info("Recorded %d frames", recorder.frames)
+    finally:
+        recorder.close()
+        writer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Record the raw tracker feed for later replay.")
+    parser.add_argument('path', help="recording path prefix")
+    parser.add_argument('--host', default='14.137.209.102')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--length-prefixed', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.get_event_loop().run_until_complete(record(args.host, args.port, args.path, args.length_prefixed))
+    except KeyboardInterrupt:
+        pass
@@ -1,64 +1,324 @@
 import asyncio
 import collections
 import enum
+import json
 import logging
-import math
+import os
 import random
-import socket
-from dataclasses import dataclass
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple, Union
 
 import numpy as np
 import websockets.exceptions
-from dataclasses_json import dataclass_json, LetterCase
 from starlette.applications import Starlette
 from starlette.endpoints import WebSocketEndpoint
-from starlette.responses import PlainTextResponse
+from starlette import status
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse
 from starlette.routing import Route, WebSocketRoute
 from starlette.types import ASGIApp, Scope, Receive, Send
 from starlette.websockets import WebSocket
 
+from analytics import TrafficAnalytics
+from broadcast import analytics_channel, BroadcastBackend, create_backend, decode_tracking, encode_tracking, \
+    MemoryBroadcast, status_channel, Subscription, tracking_channel
+from delay_line import DelayLine
+from feeds import FeedConfig, feeds_from_env
+from framing import FrameReader, FrameSource
+from history import VehicleHistory
+from metrics import metrics, Sample
+from prediction import PredictedStream
+from projection import CameraProjection, load_projections
+from recording import ReplaySource, TrackerRecorder
+from simulator import SimulatorSource, TrafficSimulator
+from spatial import parse_types, RegionFilter, SpatialGrid
+from tracking import TrackedFrame
+from trajectories import TrajectoryStore
+
 logger = logging.getLogger(__name__)
 
+metrics.describe('tracker_read_seconds', "Time waiting for the next tracker frame")
+metrics.describe('tracker_decode_seconds', "Time decoding a tracker frame")
+metrics.describe('tracker_project_seconds', "Time projecting a tracker frame from camera pixels onto the map")
+metrics.describe('tracker_history_seconds', "Time updating the vehicle history")
+metrics.describe('tracker_timeout_seconds', "Time evicting timed out vehicles")
+metrics.describe('tracker_analytics_seconds', "Time updating the traffic analytics")
+metrics.describe('room_broadcast_seconds', "Time queueing a tracking update for every client")
+metrics.describe('tracking_encode_seconds', "Time encoding a tracking update, once per format")
+metrics.describe('client_send_latency_seconds', "Time from a tracking update being queued to being sent")
 
-class ObjectType(enum.IntEnum):
-    PERSON = 0
-    BICYCLE = 1
-    CAR = 2
-    MOTORCYCLE = 3
-    BUS = 5
-    TRUCK = 7
-    TRAFFIC_LIGHT = 9
-    FIRE_HYDRANT = 10
-    STOP_SIGN = 11
-    PARKING_METER = 12
-
-
-@dataclass_json(letter_case=LetterCase.CAMEL)
-@dataclass
-class TrackedObject:
-    location: Tuple[int, int]
-    rotation: int
-    vel: Tuple[float, float]
-    obj_type: ObjectType
-    x_coeffs: Tuple[float, float, float]
-    y_coeffs: Tuple[float, float, float]
-    timestamp: float
-
-    NP_ARRAY_SIZE = 13
 
-    @classmethod
-    def from_np(cls, np_array: np.array):
-        pos_scale = 1062 / 1280
-        x_offset = 0
-        y_offset = 0
-        [obj_id, x, y, rot, speed, typ, t_stamp, xa, xb, xc, ya, yb, yc] = map(float, np_array)
-        vel = (speed * math.cos(rot) * pos_scale, -speed * math.sin(rot) * pos_scale)
-        return int(obj_id), cls(obj_type=ObjectType(int(typ)),
-                                location=(int(x * pos_scale) + x_offset, int(y * pos_scale) + y_offset),
-                                timestamp=t_stamp, vel=vel, rotation=math.pi / 2 - rot,
-                                x_coeffs=(xa, xb, xc), y_coeffs=(ya, yb, yc))
+def encode_message(message: dict) -> str:
+    return json.dumps(message, separators=(",", ":"))
+
+
+class TrackingUpdate:
+    """
+    One tick of tracking data, encoded lazily by each client's writer task.
+    Full frames are encoded at most once per wire format, and deltas at most once
+    per wire format and client view, so clients that are in sync share a single
+    encoding. Keyframes are always sent in full. Clients may ask for `basic`
+    messages without the polynomial coefficients. Clients subscribed to a
+    :class:`~.RegionFilter` receive only the matching objects; the spatial index
+    is built at most once per tick and each distinct filter is applied once.
+    """
+
+    def __init__(self, frame: TrackedFrame, tick_time: float, keyframe: bool, thresholds: Tuple[float, float, float]):
+        self.frame = frame
+        self.tick_time = tick_time
+        self.keyframe = keyframe
+        self.created_at = time.monotonic()
+        self._thresholds = thresholds
+        self._grid: Optional[SpatialGrid] = None
+        self._filtered: Dict[tuple, TrackedFrame] = {}
+        self._deltas: Dict[Tuple[Optional[tuple], int],
+                           Tuple[TrackedFrame, TrackedFrame, np.ndarray, TrackedFrame]] = {}
+        self._encoded: Dict[Tuple[bool, bool, Optional[tuple], Optional[int]], Union[str, bytes]] = {}
+
+    @property
+    def grid(self) -> SpatialGrid:
+        if self._grid is None:
+            self._grid = SpatialGrid(self.frame.location)
+        return self._grid
+
+    def filtered(self, region: Optional[RegionFilter]) -> TrackedFrame:
+        if region is None:
+            return self.frame
+        if region.key not in self._filtered:
+            self._filtered[region.key] = region.apply(self.frame, lambda: self.grid)
+        return self._filtered[region.key]
+
+    def encode(self, binary: bool, view: Optional[TrackedFrame] = None, region: Optional[RegionFilter] = None,
+               basic: bool = False) -> Tuple[Union[str, bytes], TrackedFrame]:
+        """Return the message for a client currently showing `view` (`None` for a full
+        frame) and subscribed to `region`, together with what the client will show
+        after receiving it.
+        """
+        region_key = None if region is None else region.key
+        frame = self.filtered(region)
+        if view is None or self.keyframe:
+            key = (binary, basic, region_key, None)
+            if key not in self._encoded:
+                start = metrics.clock()
+                if binary:
+                    self._encoded[key] = frame.to_binary(self.tick_time, basic=basic)
+                else:
+                    self._encoded[key] = encode_message(
+                        {"type": "TRACKING", "data": frame.to_dict(basic), "tickTime": self.tick_time})
+                metrics.observe_since('tracking_encode_seconds', start, format="binary" if binary else "json")
+            return self._encoded[key], frame
+
+        start = metrics.clock()
+        delta_key = (region_key, id(view))
+        if delta_key not in self._deltas:
+            changed, removed = view.diff(frame, *self._thresholds)
+            new_view = view.take(np.isin(view.ids, frame.ids)).merge(changed)
+            # keep `view` alive so its id cannot be reused while cached
+            self._deltas[delta_key] = (view, changed, removed, new_view)
+        _, changed, removed, new_view = self._deltas[delta_key]
+        key = (binary, basic, region_key, id(view))
+        if key not in self._encoded:
+            if binary:
+                self._encoded[key] = changed.to_binary(self.tick_time, removed=removed, basic=basic)
+            else:
+                self._encoded[key] = encode_message(
+                    {"type": "TRACKING_DELTA", "data": changed.to_dict(basic), "removed": removed.tolist(),
+                     "tickTime": self.tick_time})
+            metrics.observe_since('tracking_encode_seconds', start, format="binary_delta" if binary else "json_delta")
+        return self._encoded[key], new_view
+
+
+class ClientSender:
+    """
+    Bounded outbound queue for a single websocket, drained by its own writer task.
+    Control messages (joins, kicks, etc) are queued in order and never dropped.
+    Tracking frames use a single "latest frame wins" slot: a frame that has not
+    been sent by the time the next one arrives is replaced and counted as dropped.
+    In delta mode only changes relative to what the client last received are sent.
+    With a `region` only the objects matching it are sent, and `basic` leaves out
+    the polynomial coefficients.
+    Tracking frames are sent at no more than `max_rate_hz`; frames replaced by a
+    newer one before being sent are counted as decimated and never encoded.
+    Frames replaced while the socket is still busy with an earlier message after
+    they were due count as dropped: a client dropping frames because its socket
+    cannot keep up is throttled to half the rate it achieves, and the rate
+    recovers gradually once it keeps up again.
+    A client that lets `MAX_CONTROL_MESSAGES` control messages pile up is closed.
+    """
+
+    MAX_CONTROL_MESSAGES = 256
+    ADAPT_INTERVAL_S = 1.0
+    MIN_RATE_HZ = 1.0
+    # an unthrottled client recovering beyond this rate is unthrottled again
+    MAX_ADAPTIVE_RATE_HZ = 60.0
+
+    def __init__(self, websocket: WebSocket, binary: bool = False, delta: bool = False,
+                 region: Optional[RegionFilter] = None, max_rate_hz: Optional[float] = None, basic: bool = False):
+        self._websocket = websocket
+        self.binary = binary
+        self.delta = delta
+        self.region = region
+        self.basic = basic
+        self.max_rate_hz = max_rate_hz
+        self.rate_hz = max_rate_hz
+        self._next_frame_at = 0.0
+        self._sending = False
+        self._window_start = time.monotonic()
+        self._window_sent = 0
+        self._window_dropped = 0
+        self._view: Optional[TrackedFrame] = None
+        self._control: Deque[str] = collections.deque()
+        self._tracking: Optional[TrackingUpdate] = None
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+        self._overflowed = False
+        self.sent_messages = 0
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self.decimated_frames = 0
+        # time from a tracking update being broadcast to it being written to the socket
+        self.latency_sum_s = 0.0
+        self.latency_max_s = 0.0
+
+    @property
+    def closed(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._control) + (self._tracking is not None)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def close(self, code: int = 1000):
+        await self.stop()
+        await self._websocket.close(code=code)
+
+    async def drain(self, timeout: float = 1.0):
+        """Wait until everything queued so far has been sent (or the timeout expires).
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def send_control(self, text: str):
+        if self.closed or self._overflowed:
+            return
+        if len(self._control) >= self.MAX_CONTROL_MESSAGES:
+            logger.warning("Outbound queue overflowed, closing client")
+            self._overflowed = True
+        else:
+            self._control.append(text)
+        self._notify()
+
+    def send_tracking(self, update: TrackingUpdate):
+        if self.closed or self._overflowed:
+            return
+        if self._tracking is not None:
+            if self._sending and time.monotonic() >= self._next_frame_at:
+                self.dropped_frames += 1
+            else:
+                self.decimated_frames += 1
+        self._tracking = update
+        self._notify()
+
+    def resync(self):
+        """Send the next tracking update in full.
+        """
+        self._view = None
+
+    def _notify(self):
+        self._idle.clear()
+        self._wakeup.set()
+
+    def _adapt(self, now: float):
+        """Throttle the client if it dropped frames over the last `ADAPT_INTERVAL_S`, or
+        step its rate back up towards `max_rate_hz` if it did not.
+        """
+        elapsed = now - self._window_start
+        if elapsed < self.ADAPT_INTERVAL_S:
+            return
+        dropped = self.dropped_frames - self._window_dropped
+        if dropped:
+            achieved_hz = (self.sent_frames - self._window_sent) / elapsed
+            rate_hz = max(self.MIN_RATE_HZ, achieved_hz / 2)
+            if self.rate_hz is None or rate_hz < self.rate_hz:
+                logger.info("Client dropped %d frames, throttling to %.1f Hz", dropped, rate_hz)
+                self.rate_hz = rate_hz
+        elif self.rate_hz is not None and self.rate_hz != self.max_rate_hz:
+            self.rate_hz *= 1.25
+            if self.rate_hz >= (self.max_rate_hz or self.MAX_ADAPTIVE_RATE_HZ):
+                self.rate_hz = self.max_rate_hz
+        self._window_start = now
+        self._window_sent = self.sent_frames
+        self._window_dropped = self.dropped_frames
+
+    async def _run(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._control or self._tracking is not None:
+                    if self._overflowed:
+                        await self._websocket.close(code=1013)
+                        return
+                    update = None
+                    if self._control:
+                        message = self._control.popleft()
+                    else:
+                        wait = self._next_frame_at - time.monotonic()
+                        if wait > 0:
+                            # hold the frame back; newer frames replace it, control messages wake us up
+                            self._wakeup.clear()
+                            try:
+                                await asyncio.wait_for(self._wakeup.wait(), wait)
+                            except asyncio.TimeoutError:
+                                pass
+                            continue
+                        if self.rate_hz:
+                            self._next_frame_at = time.monotonic() + 1 / self.rate_hz
+                        update, self._tracking = self._tracking, None
+                        message, view = update.encode(self.binary, self._view if self.delta else None,
+                                                      self.region, self.basic)
+                    self._sending = True
+                    if isinstance(message, bytes):
+                        await self._websocket.send_bytes(message)
+                    else:
+                        await self._websocket.send_text(message)
+                    self._sending = False
+                    self.sent_messages += 1
+                    if update is not None:
+                        if self.delta:
+                            self._view = view
+                        now = time.monotonic()
+                        self._adapt(now)
+                        latency = now - update.created_at
+                        metrics.observe('client_send_latency_seconds', latency)
+                        self.sent_frames += 1
+                        self.latency_sum_s += latency
+                        self.latency_max_s = max(self.latency_max_s, latency)
+                self._idle.set()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except (RuntimeError, OSError) as e:
+            logger.warning("Failed to send to client: %r", e)
+        finally:
+            self._control.clear()
+            self._tracking = None
+            self._idle.set()
 
 
 class Room:
@@ -66,10 +326,16 @@ class Room:
     Room state, comprising connected users.
     """
 
-    def __init__(self):
-        logger.info("Creating new empty room")
-        self._users: Dict[str, WebSocket] = {}
-        self.backend_reconnect_pending = False
+    def __init__(self, name: str = "default", keyframe_interval: int = 50, delta_position_threshold: float = 1.0,
+                 delta_velocity_threshold: float = 1.0, delta_rotation_threshold: float = 0.05):
+        logger.info("Creating new empty room %s", name)
+        self.name = name
+        self._users: Dict[str, ClientSender] = {}
+        self.status: Optional[dict] = None
+        self.analytics: Optional[dict] = None
+        self.keyframe_interval = keyframe_interval
+        self.delta_thresholds = (delta_position_threshold, delta_velocity_threshold, delta_rotation_threshold)
+        self._tick = 0
 
     def __len__(self) -> int:
         """Get the number of users in the room.
@@ -88,15 +354,26 @@ class Room:
         """
         return list(self._users)
 
-    def add_user(self, user_id: str, websocket: WebSocket):
-        """Add a user websocket, keyed by corresponding user ID.
+    @property
+    def client_stats(self) -> Dict[str, Dict[str, float]]:
+        """Return outbound queue depth, sent/dropped counters and rate limit (0 if none) for each user.
+        """
+        return {
+            user_id: {"queue_depth": sender.queue_depth, "sent_messages": sender.sent_messages,
+                      "dropped_frames": sender.dropped_frames, "decimated_frames": sender.decimated_frames,
+                      "rate_hz": sender.rate_hz or 0}
+            for user_id, sender in self._users.items()
+        }
+
+    def add_user(self, user_id: str, sender: ClientSender):
+        """Add a user's outbound queue, keyed by corresponding user ID.
         Raises:
             ValueError: If the `user_id` already exists within the room.
         """
         if user_id in self._users:
             raise ValueError(f"User {user_id} is already in the room")
         logger.info("Adding user %s to room", user_id)
-        self._users[user_id] = websocket
+        self._users[user_id] = sender
 
     async def kick_user(self, user_id: str):
         """Forcibly disconnect a user from the room.
@@ -107,14 +384,16 @@ class Room:
         """
         if user_id not in self._users:
             raise ValueError(f"User {user_id} is not in the room")
-        await self._users[user_id].send_json(
+        sender = self._users[user_id]
+        sender.send_control(encode_message(
             {
                 "type": "ROOM_KICK",
                 "data": {"msg": "You have been kicked from the chatroom!"},
             }
-        )
+        ))
         logger.info("Kicking user %s from room", user_id)
-        await self._users[user_id].close()
+        await sender.drain()
+        await sender.close()
 
     def remove_user(self, user_id: str):
         """Remove a user from the room.
@@ -126,46 +405,64 @@ class Room:
         logger.info("Removing user %s from room", user_id)
         del self._users[user_id]
 
+    def _broadcast_control(self, text: str):
+        """Queue an already encoded control message for every connected user.
+        """
+        for sender in self._users.values():
+            sender.send_control(text)
+
     async def broadcast_message(self, user_id: str, msg: str):
         """Broadcast message to all connected users.
         """
-        for websocket in self._users.values():
-            await websocket.send_json(
-                {"type": "MESSAGE", "data": {"user_id": user_id, "msg": msg}}
-            )
+        self._broadcast_control(encode_message({"type": "MESSAGE", "data": {"user_id": user_id, "msg": msg}}))
 
-    async def broadcast_tracking(self, objects: Dict[int, TrackedObject], tick_time: float, delay_s: float = 0):
-        if delay_s:
-            await asyncio.sleep(delay_s)
-        for user_id, websocket in self._users.items():
-            try:
-                await websocket.send_json(
-                    {"type": "TRACKING", "data": {k: o.to_dict() for k, o in objects.items()},
-                     "tickTime": tick_time}
-                )
-            except websockets.exceptions.ConnectionClosed:
-                # client has died, just remove it
-                try:
-                    self.remove_user(user_id)
-                except ValueError:
-                    pass
+    async def broadcast_tracking(self, objects: TrackedFrame, tick_time: float):
+        """Broadcast tracked objects to all connected users. The update is queued for
+        every client, replacing any update it has not sent yet, and encoded once per
+        wire format (and delta baseline) when sent. Every `keyframe_interval` ticks
+        delta clients receive the full frame.
+        """
+        start = metrics.clock()
+        update = TrackingUpdate(objects, tick_time, keyframe=self._tick % self.keyframe_interval == 0,
+                                thresholds=self.delta_thresholds)
+        self._tick += 1
+        for sender in self._users.values():
+            sender.send_tracking(update)
+        metrics.observe_since('room_broadcast_seconds', start, camera=self.name)
+
+    def update_status(self, status: dict):
+        """Record the feed's health (see `VehicleTracker.status`) and send it to every
+        user if it changed.
+        """
+        if status == self.status:
+            return
+        self.status = status
+        self._broadcast_control(self.status_message())
+
+    def status_message(self) -> str:
+        return encode_message({"type": "FEED_STATUS", "data": {"camera": self.name, **(self.status or {})}})
+
+    def update_analytics(self, analytics: dict):
+        """Record the feed's latest traffic statistics (see `TrafficAnalytics.snapshot`)
+        and send them to every user.
+        """
+        self.analytics = analytics
+        self._broadcast_control(encode_message({"type": "ANALYTICS", "data": {"camera": self.name, **analytics}}))
 
     async def broadcast_user_joined(self, user_id: str):
         """Broadcast message to all connected users.
         """
-        for websocket in self._users.values():
-            await websocket.send_json({"type": "USER_JOIN", "data": user_id})
+        self._broadcast_control(encode_message({"type": "USER_JOIN", "data": user_id}))
 
     async def broadcast_user_left(self, user_id: str):
         """Broadcast message to all connected users.
         """
-        for websocket in self._users.values():
-            await websocket.send_json({"type": "USER_LEAVE", "data": user_id})
+        self._broadcast_control(encode_message({"type": "USER_LEAVE", "data": user_id}))
 
 
 class RoomEventMiddleware:  # pylint: disable=too-few-public-methods
-    """Middleware for providing a global :class:`~.Room` instance to both HTTP
-    and WebSocket scopes.
+    """Middleware for providing the global :class:`~.TrackerManager`, which holds
+    the :class:`~.Room` of every camera, to both HTTP and WebSocket scopes.
     Although it might seem odd to load the broadcast interface like this (as
     opposed to, e.g. providing a global) this both mimics the pattern
     established by starlette's existing DatabaseMiddlware, and describes a
@@ -176,15 +473,32 @@ class RoomEventMiddleware:  # pylint: disable=too-few-public-methods
 
     def __init__(self, app: ASGIApp):
         self._app = app
-        self._room = global_room
+        self._trackers = tracker_manager
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send):
         if scope["type"] in ("lifespan", "http", "websocket"):
-            scope["room"] = self._room
+            scope["trackers"] = self._trackers
         await self._app(scope, receive, send)
 
 
 class Stream(WebSocketEndpoint):
+    """
+    Websocket endpoint streaming room events and tracking frames.
+    Clients join the room of the camera named in the path (`/stream/<camera>`), or
+    of the first configured camera on `/stream`.
+    TRACKING messages are JSON by default. Clients may opt into the packed binary
+    encoding (see `tracking.BINARY_HEADER`) with the `format=binary` query
+    parameter or by requesting the `BINARY_SUBPROTOCOL` subprotocol, and into
+    TRACKING_DELTA updates with `delta=1`. Delta clients can send "RESYNC" to
+    receive the next update in full. FEED_STATUS messages report the health of
+    the upstream tracker feed on joining and whenever it changes. Clients can
+    limit TRACKING messages to a region and object types with the `bbox`,
+    `polygon` and `types` query parameters (see `RegionFilter.from_query`), to
+    `max_rate` updates per second, and to `detail=basic` objects without
+    polynomial coefficients.
+    """
+    BINARY_SUBPROTOCOL = "tracking.binary.v2"
+
     encoding: str = "text"
     session_name: str = ""
     count: int = 0
@@ -193,6 +507,7 @@ class Stream(WebSocketEndpoint):
         super().__init__(*args, **kwargs)
         self.room: Optional[Room] = None
         self.user_id: Optional[str] = None
+        self.sender: Optional[ClientSender] = None
 
     @classmethod
     def get_next_user_id(cls):
@@ -203,6 +518,22 @@ class Stream(WebSocketEndpoint):
         cls.count += 1
         return user_id
 
+    @staticmethod
+    def parse_max_rate(value: Optional[str]) -> Optional[float]:
+        """Parse the `max_rate` query parameter, in updates per second.
+        Raises:
+            ValueError: If it is not a positive number.
+        """
+        if value is None:
+            return None
+        try:
+            rate_hz = float(value)
+        except ValueError:
+            rate_hz = 0.0
+        if not rate_hz > 0:
+            raise ValueError("`max_rate` must be a positive number")
+        return rate_hz
+
     async def on_connect(self, websocket):
         """Handle a new connection.
         New users are assigned a user ID and notified of the room's connected
@@ -210,174 +541,654 @@ class Stream(WebSocketEndpoint):
         and finally the new user is added to the global :class:`~.Room` instance.
         """
         logger.info("Connecting new user...")
-        room: Optional[Room] = self.scope.get("room")
+        trackers: Optional[TrackerManager] = self.scope.get("trackers")
+        if trackers is None:
+            raise RuntimeError(f"Global `TrackerManager` instance unavailable!")
+        room = trackers.room(self.scope.get("path_params", {}).get("camera"))
         if room is None:
-            raise RuntimeError(f"Global `Room` instance unavailable!")
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        try:
+            region = RegionFilter.from_query(websocket.query_params)
+            max_rate_hz = self.parse_max_rate(websocket.query_params.get("max_rate"))
+            detail = websocket.query_params.get("detail", "full")
+            if detail not in ("full", "basic"):
+                raise ValueError("`detail` must be full or basic")
+        except ValueError as e:
+            logger.info("Rejecting subscription: %s", e)
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
         self.room = room
         self.user_id = self.get_next_user_id()
-        await websocket.accept()
-        await websocket.send_json(
+        binary = websocket.query_params.get("format") == "binary"
+        subprotocol = None
+        if self.BINARY_SUBPROTOCOL in self.scope.get("subprotocols", []):
+            binary = True
+            subprotocol = self.BINARY_SUBPROTOCOL
+        await websocket.accept(subprotocol=subprotocol)
+        delta = websocket.query_params.get("delta") in ("1", "true")
+        self.sender = ClientSender(websocket, binary=binary, delta=delta, region=region, max_rate_hz=max_rate_hz,
+                                   basic=detail == "basic")
+        self.sender.start()
+        self.sender.send_control(encode_message(
             {"type": "ROOM_JOIN", "data": {"user_id": self.user_id}}
-        )
+        ))
+        if self.room.status is not None:
+            self.sender.send_control(self.room.status_message())
         await self.room.broadcast_user_joined(self.user_id)
-        self.room.add_user(self.user_id, websocket)
-        self.room.backend_reconnect_pending = True
+        self.room.add_user(self.user_id, self.sender)
 
     async def on_disconnect(self, _websocket: WebSocket, _close_code: int):
         """Disconnect the user, removing them from the :class:`~.Room`, and
         notifying the other users of their departure.
         """
+        if self.room is None:
+            # rejected before joining
+            return
         if self.user_id is None:
             raise RuntimeError(
                 "RoomLive.on_disconnect() called without a valid user_id"
             )
+        await self.sender.stop()
         self.room.remove_user(self.user_id)
         await self.room.broadcast_user_left(self.user_id)
 
     async def on_receive(self, websocket, data):
-        await websocket.send_text(f"Message text was: {data}")
+        if data == "RESYNC":
+            self.sender.resync()
+            return
+        self.sender.send_control(f"Message text was: {data}")
+
+
+class FeedState(enum.Enum):
+    CONNECTING = "connecting"
+    CONNECTED = "connected"
+    RECONNECTING = "reconnecting"
+    # tracker unreachable, streaming simulated traffic until it is back
+    DEGRADED = "degraded"
+    REPLAY = "replay"
+    STOPPED = "stopped"
 
 
 class VehicleTracker:
+    """
+    Reads the tracker feed and broadcasts the tracked objects.
+    The connection is only re-established when the socket fails or reaches EOF.
+    If the tracker cannot be reached, simulated traffic is streamed instead while
+    reconnection is retried in the background with jittered exponential backoff,
+    and the live feed resumes as soon as the tracker is back. A connection that is
+    dropped within `STABLE_CONNECTION_S` of opening is treated the same way, so a
+    tracker that accepts and closes connections is not reconnected in a hot loop.
+    """
     MAX_HISTORY_POINTS = 3
     VEHICLE_TIMEOUT_S = 0.8
+    CONNECT_TIMEOUT_S = 1.5
+    RECONNECT_BACKOFF_S = 0.5
+    MAX_RECONNECT_BACKOFF_S = 30.0
+    STABLE_CONNECTION_S = 5.0
 
-    _vehicle_history: Dict[int, List[TrackedObject]]
+    _vehicle_history: VehicleHistory
+    delay_line: DelayLine
+    predictor: PredictedStream
     fake_mode: bool
+    length_prefixed: bool
     socket_reader: Optional[asyncio.StreamReader]
     socket_writer: Optional[asyncio.StreamWriter]
+    frame_reader: Optional[FrameReader]
+    source: Optional[FrameSource]
+    fake_source: SimulatorSource
+    recorder: Optional[TrackerRecorder]
+    trajectories: Optional[TrajectoryStore]
+    analytics: Optional[TrafficAnalytics]
+    projection: Optional[CameraProjection]
     _room: Optional[Room]
+    name: str
     host: Optional[str]
     port: Optional[int]
+    state: FeedState
+    state_since: float
+    reconnect_attempts: int
+    last_error: Optional[str]
+    on_status: Optional[Callable[[dict], None]]
 
-    def __init__(self, room: Room):
-        self._vehicle_history = collections.defaultdict(list)
+    def __init__(self, room: Room, length_prefixed: bool = False, broadcast_delay_s: float = 3.3,
+                 max_delayed_frames: int = 512, history_depth: int = MAX_HISTORY_POINTS,
+                 prediction_lead_s: float = 0.0, output_rate_hz: Optional[float] = None,
+                 fake_object_count: int = 20, name: str = "default",
+                 broadcast: Optional[Callable[[TrackedFrame, float], Awaitable[None]]] = None):
+        self._vehicle_history = VehicleHistory(depth=history_depth)
+        # hold frames back to line up with the video latency, less however far ahead we predict
+        self.delay_line = DelayLine(max(0.0, broadcast_delay_s - prediction_lead_s), self._release,
+                                    capacity=max_delayed_frames)
+        self.predictor = PredictedStream(broadcast or room.broadcast_tracking, output_rate_hz=output_rate_hz,
+                                         lead_s=prediction_lead_s)
         self.fake_mode = False
+        self.length_prefixed = length_prefixed
         self.socket_reader = None
         self.socket_writer = None
+        self.frame_reader = None
+        self.source = None
+        self.fake_source = SimulatorSource(TrafficSimulator(fake_object_count), rate_hz=50)
+        self.recorder = None
+        self.trajectories = None
+        self.analytics = None
+        self.projection = None
         self._room = room
+        self.name = name
         self.host = None
         self.port = None
-        self._task_references = set()
+        self.state = FeedState.CONNECTING
+        self.state_since = time.time()
+        self.reconnect_attempts = 0
+        self.last_error = None
+        self.on_status = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._connected_at = 0.0
+        # connections dropped in a row within STABLE_CONNECTION_S of opening
+        self._quick_drops = 0
 
-    def update_history(self, vehicle_id: int, obj: TrackedObject):
-        self._vehicle_history[vehicle_id].append(obj)
-        if len(self._vehicle_history[vehicle_id]) > self.MAX_HISTORY_POINTS:
-            # remove old point
-            self._vehicle_history[vehicle_id].pop(0)
+    def update_history(self, frame: TrackedFrame):
+        self._vehicle_history.append(frame)
 
     def apply_timeout(self, timestamp: float):
-        for k in list(self._vehicle_history.keys()):
-            vehicles = self._vehicle_history[k]
-            if timestamp - vehicles[-1].timestamp > self.VEHICLE_TIMEOUT_S:
-                self._vehicle_history.pop(k)
+        self._vehicle_history.evict_older_than(timestamp - self.VEHICLE_TIMEOUT_S)
 
     @property
-    def current_vehicles(self) -> Dict[int, TrackedObject]:
-        return {key: objs[-1] for key, objs in self._vehicle_history.items()}
+    def current_vehicles(self) -> TrackedFrame:
+        return self._vehicle_history.snapshot()
 
-    async def connect(self, host: str, port: int):
-        self.host = host
-        self.port = port
+    @property
+    def status(self) -> dict:
+        return {"state": self.state.value, "since": self.state_since, "reconnectAttempts": self.reconnect_attempts,
+                "lastError": self.last_error}
+
+    def _set_state(self, state: FeedState):
+        if state is self.state:
+            return
+        self.state = state
+        self.state_since = time.time()
+        if self.on_status is not None:
+            self.on_status(self.status)
 
+    async def _open(self) -> bool:
+        """Try once to open the tracker socket.
+        """
         try:
-            fut = asyncio.open_connection(host, port)
-            self.socket_reader, self.socket_writer = await asyncio.wait_for(fut, timeout=1.5)
+            fut = asyncio.open_connection(self.host, self.port)
+            self.socket_reader, self.socket_writer = await asyncio.wait_for(fut, timeout=self.CONNECT_TIMEOUT_S)
             self.socket_writer.write(bytes("", "utf-8"))
             await self.socket_writer.drain()
-            self.fake_mode = False
-        except socket.error as e:
-            logger.warning(f"Not able to connect. Using fake data (\"{e}\")")
-            self.fake_mode = True
+        except OSError as e:
+            self.last_error = str(e)
+            return False
         except asyncio.TimeoutError:
-            logger.warning(f"Connection to {host}:{port} timed out. Using fake data.")
-            self.fake_mode = True
+            self.last_error = f"Connection to {self.host}:{self.port} timed out"
+            return False
+        self.frame_reader = FrameReader(self.socket_reader, length_prefixed=self.length_prefixed)
+        self._connected_at = time.monotonic()
+        self.fake_mode = False
+        self._set_state(FeedState.CONNECTED)
+        return True
+
+    async def connect(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        if not await self._open():
+            logger.warning("Not able to connect to %s:%d. Using fake data (\"%s\")", host, port, self.last_error)
+            self._degrade()
+
+    def _degrade(self):
+        """Stream fake data and keep trying to reconnect in the background.
+        """
+        self.fake_mode = True
+        self._set_state(FeedState.DEGRADED)
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    def reconnect_delay(self, attempt: int) -> float:
+        """Exponential backoff with jitter, so that many servers do not retry in lockstep.
+        """
+        delay = min(self.RECONNECT_BACKOFF_S * 2 ** min(attempt, 32), self.MAX_RECONNECT_BACKOFF_S)
+        return delay * random.uniform(0.5, 1)
+
+    async def _reconnect(self):
+        attempt = 0
+        while self.fake_mode and self.source is None:
+            # back off further for every connection that was dropped right after opening
+            await asyncio.sleep(self.reconnect_delay(self._quick_drops + attempt))
+            attempt += 1
+            self.reconnect_attempts += 1
+            if await self._open():
+                logger.warning("Reconnected to %s:%d after %d attempts.", self.host, self.port, attempt)
+
+    def use_source(self, source: FrameSource):
+        """Read frames from a recording, simulator, etc instead of the tracker socket.
+        """
+        self.source = source
+        self.fake_mode = False
+        self._set_state(FeedState.REPLAY)
 
     async def close(self):
-        if not self.fake_mode:
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self.socket_writer is not None:
             self.socket_writer.close()
             # await self.socket_writer.wait_closed()
         self.socket_writer = None
         self.socket_reader = None
+        self.frame_reader = None
+
+    async def _release(self, item: Tuple[TrackedFrame, float]):
+        objects, tick_time = item
+        await self.predictor.update(objects, tick_time)
+
+    def _collect_metrics(self) -> Iterable[Sample]:
+        labels = {"camera": self.name}
+        yield 'tracker_tracked_objects', labels, len(self._vehicle_history)
+        yield 'tracker_delayed_frames', labels, len(self.delay_line)
+        yield 'tracker_delay_overflowed_frames_total', labels, self.delay_line.overflowed
+        yield 'tracker_delay_max_lateness_seconds', labels, self.delay_line.max_lateness_s
+        yield 'tracker_fake_mode', labels, int(self.fake_mode)
+        yield 'tracker_reconnect_attempts_total', labels, self.reconnect_attempts
 
     async def listen(self):
-        packet_size = 4096
-        max_size = ((packet_size // 8) // TrackedObject.NP_ARRAY_SIZE) * TrackedObject.NP_ARRAY_SIZE
+        delay_task = asyncio.create_task(self.delay_line.run())
+        predictor_task = asyncio.create_task(self.predictor.run())
+        metrics.register_collector(self._collect_metrics)
+        try:
+            await self._receive_loop()
+        finally:
+            metrics.unregister_collector(self._collect_metrics)
+            delay_task.cancel()
+            predictor_task.cancel()
+            if self.recorder is not None:
+                self.recorder.flush()
 
+    async def _receive_loop(self):
         new_time = datetime.now()
-        next_loc = None
         while True:
             try:
-                if self._room.backend_reconnect_pending is True:
-                    logger.warning("Triggering reconnect...")
-                    self._room.backend_reconnect_pending = False
-                    raise websockets.WebSocketException()
-
                 prev_time = new_time
                 new_time = datetime.now()
                 elapsed = (new_time - prev_time).total_seconds() or 0.1
-                if self.fake_mode is False:
-                    data = await self.socket_reader.read(packet_size)
-                    received = np.frombuffer(data, dtype=np.float32)
-                    received = received[0:min(max_size, len(received))]
-                    received = received.reshape(
-                        (len(received) // TrackedObject.NP_ARRAY_SIZE, TrackedObject.NP_ARRAY_SIZE))
-                    received_pairs = [TrackedObject.from_np(row) for row in received]
-                    object_data = {obj_id: obj for (obj_id, obj) in received_pairs}
+                if self.source is not None:
+                    source = self.source
+                elif self.fake_mode is False:
+                    source = self.frame_reader
                 else:
-                    new_loc = next_loc or (200 + random.randint(-100, 100), 300 + random.randint(-100, 100))
-                    next_loc = (200 + random.randint(-100, 100), 300 + random.randint(-100, 100))
-                    diff = ((next_loc[0] - new_loc[0]) / elapsed, (next_loc[1] - new_loc[1]) / elapsed)
-                    object_data = {
-                        1: TrackedObject(location=(450, 300), rotation=0, vel=(0, 0), obj_type=ObjectType.CAR,
-                                         x_coeffs=(0, 0, 0), y_coeffs=(0, 0, 0), timestamp=0),
-                        2: TrackedObject(location=new_loc, rotation=0, vel=diff, obj_type=ObjectType.PERSON,
-                                         x_coeffs=(0, 0, 0), y_coeffs=(0, 0, 0), timestamp=0)
-                    }
-                for k, obj in object_data.items():
-                    self.update_history(k, obj)
-
-                try:
-                    last_timestamp = next(iter(object_data.values())).timestamp
-                    self.apply_timeout(last_timestamp)
-                except StopIteration:
-                    pass
-
-                bc_task = asyncio.create_task(
-                    self._room.broadcast_tracking(self.current_vehicles, elapsed, delay_s=3.3))
-                self._task_references.add(bc_task)
-                bc_task.add_done_callback(lambda f: self._task_references.remove(f))
+                    source = self.fake_source
+                start = metrics.clock()
+                received = await source.read_frame()
+                metrics.observe_since('tracker_read_seconds', start, camera=self.name)
+                if self.recorder is not None and source is self.frame_reader:
+                    self.recorder.write(received)
+                # simulated traffic is already in map coordinates, only camera records are projected
+                if self.projection is not None and (source is self.frame_reader or isinstance(source, ReplaySource)):
+                    start = metrics.clock()
+                    received = self.projection.project_records(received)
+                    metrics.observe_since('tracker_project_seconds', start, camera=self.name)
 
-                await asyncio.sleep(0.02)
-            except websockets.WebSocketException:
-                logger.warning("A client connection was interrupted. Reconnecting...")
-                # Attempt to reconnect
+                start = metrics.clock()
+                frame = TrackedFrame.from_np(received)
+                metrics.observe_since('tracker_decode_seconds', start, camera=self.name)
+                metrics.inc('tracker_frames_total', camera=self.name)
+                metrics.inc('tracker_objects_total', len(frame), camera=self.name)
+                if self.trajectories is not None:
+                    self.trajectories.append(frame)
+
+                start = metrics.clock()
+                self.update_history(frame)
+                metrics.observe_since('tracker_history_seconds', start, camera=self.name)
+
+                if len(frame):
+                    start = metrics.clock()
+                    self.apply_timeout(frame.timestamp[0])
+                    metrics.observe_since('tracker_timeout_seconds', start, camera=self.name)
+
+                if self.analytics is not None:
+                    start = metrics.clock()
+                    self.analytics.update(self.current_vehicles)
+                    metrics.observe_since('tracker_analytics_seconds', start, camera=self.name)
+
+                self.delay_line.push((self.current_vehicles, elapsed))
+            except EOFError:
+                logger.warning("Replay finished.")
+                self._set_state(FeedState.STOPPED)
+                return
+            except ConnectionError as e:
+                metrics.inc('tracker_reconnects_total', camera=self.name)
+                logger.warning("Tracker connection to %s:%d lost (%r). Reconnecting...", self.host, self.port, e)
+                self.last_error = str(e) or repr(e)
+                if time.monotonic() - self._connected_at < self.STABLE_CONNECTION_S:
+                    self._quick_drops += 1
+                else:
+                    self._quick_drops = 0
                 await self.close()
-                await self.connect(self.host, self.port)
-                logger.warning("Reconnected.")
+                self._set_state(FeedState.RECONNECTING)
+                if self._quick_drops:
+                    logger.warning("Connection dropped right after opening. Using fake data until reconnected.")
+                    self._degrade()
+                elif not await self._open():
+                    logger.warning("Not able to reconnect. Using fake data (\"%s\")", self.last_error)
+                    self._degrade()
             except ValueError:
+                metrics.inc('tracker_invalid_frames_total', camera=self.name)
                 logger.exception("Invalid data received.")
                 await asyncio.sleep(0.02)
 
 
-async def init_tracker():
-    loop = asyncio.get_event_loop()
-    tracker = VehicleTracker(global_room)
-    await tracker.connect('14.137.209.102', 7777)
-    loop.create_task(tracker.listen())
+class TrackerManager:
+    """
+    Runs one :class:`~.VehicleTracker` per configured feed, each publishing to its
+    own channel of the broadcast `backend`, which relays the frames to the feed's
+    :class:`~.Room`. Every feed connects in its own task, so a slow or
+    unreachable tracker never delays the others, and a tracker that fails is
+    restarted after an exponential backoff without affecting the other feeds.
+    With `ingest` unset no trackers are run and rooms are only fed from the
+    backend, and with `fan_out` unset frames are only published, so one ingest
+    process can serve any number of websocket workers (see `broadcast.py`).
+    With a `history_dir`, every ingested feed is also written to a
+    :class:`~.TrajectoryStore`, which any process sharing the directory can query.
+    Every ingested feed's :class:`~.TrafficAnalytics` are published every
+    `ANALYTICS_INTERVAL_S` and sent to the room's users. Feeds in camera pixels
+    are projected with the camera's entry in `projections`.
+    """
+    RESTART_BACKOFF_S = 1.0
+    MAX_RESTART_BACKOFF_S = 30.0
+    # feed health is republished periodically for workers subscribing late
+    STATUS_INTERVAL_S = 5.0
+    ANALYTICS_INTERVAL_S = 1.0
+    # how long shutdown waits for cancelled feeds, e.g. stuck connecting or ignoring cancellation
+    STOP_TIMEOUT_S = 5.0
+
+    backend: BroadcastBackend
+    ingest: bool
+    fan_out: bool
+    feeds: Dict[str, FeedConfig]
+    rooms: Dict[str, Room]
+    trackers: Dict[str, VehicleTracker]
+    history: Dict[str, TrajectoryStore]
+    default: Optional[str]
+
+    def __init__(self, backend: Optional[BroadcastBackend] = None, ingest: bool = True, fan_out: bool = True,
+                 history_dir: Optional[str] = None, history_retention_s: float = 24 * 3600.0,
+                 projections: Optional[Dict[str, CameraProjection]] = None):
+        self.backend = backend or MemoryBroadcast()
+        self.ingest = ingest
+        self.fan_out = fan_out
+        self.history_dir = history_dir
+        self.history_retention_s = history_retention_s
+        self.projections = projections or {}
+        self.feeds = {}
+        self.rooms = {}
+        self.trackers = {}
+        self.history = {}
+        self.default = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._subscriptions: List[Subscription] = []
+
+    def add_feed(self, feed: FeedConfig) -> Optional[VehicleTracker]:
+        """Create the room and, when ingesting, the tracker for a feed. The first feed
+        added is the default.
+        Raises:
+            ValueError: If a feed with the same name already exists, or a feed in camera
+                pixels has no calibration.
+        """
+        if feed.name in self.feeds:
+            raise ValueError(f"Feed {feed.name} already exists")
+        if self.ingest and feed.pixel_coordinates and feed.name not in self.projections:
+            raise ValueError(f"Feed {feed.name} reports camera pixels, but its calibration is missing or incomplete")
+        room = Room(name=feed.name)
+        self.feeds[feed.name] = feed
+        self.rooms[feed.name] = room
+        if self.default is None:
+            self.default = feed.name
+        if self.history_dir is not None:
+            self.history[feed.name] = TrajectoryStore(os.path.join(self.history_dir, feed.name),
+                                                      retention_s=self.history_retention_s)
+        if not self.ingest:
+            return None
+        channel = tracking_channel(feed.name)
+
+        async def publish(frame: TrackedFrame, tick_time: float):
+            await self.backend.publish(channel, encode_tracking(frame, tick_time))
+
+        tracker = VehicleTracker(room, length_prefixed=feed.length_prefixed, broadcast_delay_s=feed.broadcast_delay_s,
+                                 prediction_lead_s=feed.prediction_lead_s, output_rate_hz=feed.output_rate_hz,
+                                 name=feed.name, broadcast=publish)
+        tracker.on_status = lambda status: self._publish_status(feed.name, status)
+        tracker.analytics = TrafficAnalytics(feed.zones, feed.lines, window_s=feed.analytics_window_s)
+        if feed.replay:
+            tracker.use_source(ReplaySource(feed.replay, speed=feed.replay_speed, loop=True))
+        elif feed.record:
+            tracker.recorder = TrackerRecorder(feed.record)
+        tracker.trajectories = self.history.get(feed.name)
+        if feed.pixel_coordinates:
+            tracker.projection = self.projections[feed.name]
+        self.trackers[feed.name] = tracker
+        return tracker
+
+    def room(self, name: Optional[str] = None) -> Optional[Room]:
+        """Return the room of the named feed, or of the default feed if `name` is `None`.
+        """
+        return self.rooms.get(self.default if name is None else name)
+
+    async def start(self):
+        await self.backend.connect()
+        if self.fan_out:
+            for name, room in self.rooms.items():
+                subscription = self.backend.subscribe(tracking_channel(name))
+                self._subscriptions.append(subscription)
+                self._tasks[f"relay.{name}"] = asyncio.ensure_future(self._relay(room, subscription))
+                subscription = self.backend.subscribe(status_channel(name))
+                self._subscriptions.append(subscription)
+                self._tasks[f"status.{name}"] = asyncio.ensure_future(self._relay_control(subscription,
+                                                                                          room.update_status))
+                subscription = self.backend.subscribe(analytics_channel(name))
+                self._subscriptions.append(subscription)
+                self._tasks[f"analytics.{name}"] = asyncio.ensure_future(self._relay_control(subscription,
+                                                                                             room.update_analytics))
+        for name in self.trackers:
+            self._tasks[name] = asyncio.ensure_future(self._run(name))
+        if self.trackers:
+            self._tasks["status"] = asyncio.ensure_future(self._republish_status())
+            self._tasks["analytics"] = asyncio.ensure_future(self._publish_analytics())
+
+    async def stop(self):
+        tasks = dict(self._tasks)
+        self._tasks.clear()
+        for task in tasks.values():
+            task.cancel()
+        if tasks:
+            _, pending = await asyncio.wait(tasks.values(), timeout=self.STOP_TIMEOUT_S)
+            if pending:
+                logger.warning("Tasks did not stop within %.1f s: %s", self.STOP_TIMEOUT_S,
+                               ", ".join(name for name, task in tasks.items() if task in pending))
+        for subscription in self._subscriptions:
+            self.backend.unsubscribe(subscription)
+        self._subscriptions.clear()
+        await self.backend.disconnect()
+        for tracker in self.trackers.values():
+            await tracker.close()
+            if tracker.recorder is not None:
+                tracker.recorder.close()
+        for store in self.history.values():
+            await run_in_threadpool(store.close)
+
+    @staticmethod
+    async def _relay(room: Room, subscription: Subscription):
+        async for message in subscription:
+            try:
+                frame, tick_time = decode_tracking(message)
+            except ValueError:
+                logger.exception("Invalid message on %s", subscription.channel)
+                continue
+            await room.broadcast_tracking(frame, tick_time)
+
+    @staticmethod
+    async def _relay_control(subscription: Subscription, handler: Callable[[dict], None]):
+        async for message in subscription:
+            try:
+                handler(json.loads(message))
+            except ValueError:
+                logger.exception("Invalid message on %s", subscription.channel)
+
+    def _publish_status(self, name: str, status: dict):
+        asyncio.ensure_future(self.backend.publish(status_channel(name), encode_message(status).encode()))
+
+    async def _republish_status(self):
+        while True:
+            for name, tracker in self.trackers.items():
+                self._publish_status(name, tracker.status)
+            await asyncio.sleep(self.STATUS_INTERVAL_S)
+
+    async def _publish_analytics(self):
+        while True:
+            await asyncio.sleep(self.ANALYTICS_INTERVAL_S)
+            for name, tracker in self.trackers.items():
+                if tracker.analytics is not None and tracker.analytics.updated_at is not None:
+                    message = encode_message(tracker.analytics.snapshot()).encode()
+                    await self.backend.publish(analytics_channel(name), message)
+
+    async def _run(self, name: str):
+        feed = self.feeds[name]
+        tracker = self.trackers[name]
+        loop = asyncio.get_event_loop()
+        failures = 0
+        while True:
+            started_at = loop.time()
+            try:
+                if tracker.source is None:
+                    await tracker.connect(feed.host, feed.port)
+                await tracker.listen()
+                logger.info("Feed %s finished", name)
+                return
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Tracker for feed %s failed", name)
+                metrics.inc('tracker_restarts_total', camera=name)
+            await tracker.close()
+            if loop.time() - started_at > self.MAX_RESTART_BACKOFF_S:
+                failures = 0
+            await asyncio.sleep(min(self.RESTART_BACKOFF_S * 2 ** failures, self.MAX_RESTART_BACKOFF_S))
+            failures += 1
+
+
+async def init_trackers():
+    for feed in feeds_from_env():
+        tracker_manager.add_feed(feed)
+    await tracker_manager.start()
 
 
 async def homepage(request):
     return PlainTextResponse("Homepage")
 
 
-global_room = Room()
+async def cameras(request):
+    """List the configured cameras, with their connected users and feed health.
+    """
+    trackers: TrackerManager = request.scope["trackers"]
+    return JSONResponse([
+        {"name": name, "users": len(room), "status": room.status}
+        for name, room in trackers.rooms.items()
+    ])
+
+
+def _parse_history_query(params, now: float) -> Tuple[float, float, Optional[List[int]], Optional[Tuple[int, ...]]]:
+    try:
+        end = float(params.get("end", now))
+        start = float(params.get("start", end - 60))
+        ids = [int(v) for v in params["ids"].split(",") if v.strip()] if "ids" in params else None
+    except ValueError:
+        raise ValueError("`start` and `end` must be UNIX times and `ids` a comma separated list of IDs") from None
+    types = parse_types(params["types"]) if "types" in params else None
+    return start, end, ids, types
+
+
+async def history(request):
+    """Return the stored trajectory of every object seen on a camera between the `start`
+    and `end` UNIX times (default: the last minute), optionally only for the given `ids`
+    and `types`.
+    """
+    trackers: TrackerManager = request.scope["trackers"]
+    store = trackers.history.get(request.path_params["camera"])
+    if store is None:
+        return JSONResponse({"error": "No history for this camera"}, status_code=404)
+    try:
+        start, end, ids, types = _parse_history_query(request.query_params, time.time())
+        objects = await run_in_threadpool(store.trajectories, start, end, ids, types)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return JSONResponse({"camera": request.path_params["camera"], "start": start, "end": end, "objects": objects})
+
+
+async def history_extent(request):
+    """Return the times of the first and last stored ticks of a camera.
+    """
+    trackers: TrackerManager = request.scope["trackers"]
+    store = trackers.history.get(request.path_params["camera"])
+    if store is None:
+        return JSONResponse({"error": "No history for this camera"}, status_code=404)
+    extent = await run_in_threadpool(store.extent)
+    return JSONResponse({"start": extent[0], "end": extent[1]} if extent else {"start": None, "end": None})
+
+
+async def analytics(request):
+    """Return a camera's traffic statistics: zone occupancy, entries, dwell times and
+    speeds, and line crossings, broken down by object type.
+    """
+    trackers: TrackerManager = request.scope["trackers"]
+    name = request.path_params["camera"]
+    if name not in trackers.rooms:
+        return JSONResponse({"error": "Unknown camera"}, status_code=404)
+    tracker = trackers.trackers.get(name)
+    if tracker is not None and tracker.analytics is not None and tracker.analytics.updated_at is not None:
+        return JSONResponse({"camera": name, **tracker.analytics.snapshot()})
+    if trackers.rooms[name].analytics is None:
+        return JSONResponse({"error": "No analytics for this camera yet"}, status_code=404)
+    return JSONResponse({"camera": name, **trackers.rooms[name].analytics})
+
+
+async def metrics_endpoint(request):
+    """Expose pipeline timings, counters and per-client queue stats in the Prometheus text format.
+    """
+    trackers: TrackerManager = request.scope["trackers"]
+    samples: List[Sample] = []
+    for name, room in trackers.rooms.items():
+        samples.append(('room_users', {"camera": name}, len(room)))
+        for user_id, stats in room.client_stats.items():
+            labels = {"camera": name, "user": user_id}
+            samples.append(('client_queue_depth', labels, stats["queue_depth"]))
+            samples.append(('client_sent_messages_total', labels, stats["sent_messages"]))
+            samples.append(('client_dropped_frames_total', labels, stats["dropped_frames"]))
+            samples.append(('client_decimated_frames_total', labels, stats["decimated_frames"]))
+            samples.append(('client_rate_limit_hz', labels, stats["rate_hz"]))
+    return PlainTextResponse(metrics.render(samples), media_type="text/plain; version=0.0.4")
+
+
+broadcast_role = os.environ.get('BROADCAST_ROLE', 'all')
+if broadcast_role not in ('all', 'ingest', 'worker'):
+    raise ValueError(f"BROADCAST_ROLE must be all, ingest or worker, not {broadcast_role}")
+tracker_manager = TrackerManager(create_backend(os.environ.get('BROADCAST_URL', 'memory://'),
+                                                serve=broadcast_role != 'worker'),
+                                 ingest=broadcast_role != 'worker', fan_out=broadcast_role != 'ingest',
+                                 history_dir=os.environ.get('HISTORY_DIR'),
+                                 history_retention_s=float(os.environ.get('HISTORY_RETENTION_S', 24 * 3600)),
+                                 projections=load_projections(os.environ['CAMERA_CONFIG'])
+                                 if 'CAMERA_CONFIG' in os.environ else None)
 routes = [
     Route('/', endpoint=homepage),
-    WebSocketRoute('/stream', endpoint=Stream)
+    Route('/cameras', endpoint=cameras),
+    Route('/history/{camera}', endpoint=history),
+    Route('/history/{camera}/extent', endpoint=history_extent),
+    Route('/analytics/{camera}', endpoint=analytics),
+    Route('/metrics', endpoint=metrics_endpoint),
+    WebSocketRoute('/stream', endpoint=Stream),
+    WebSocketRoute('/stream/{camera}', endpoint=Stream)
 ]
 app = Starlette(
     routes=routes,
-    on_startup=[init_tracker]
+    on_startup=[init_trackers],
+    on_shutdown=[tracker_manager.stop]
 )
 app.add_middleware(RoomEventMiddleware)
@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import logging
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+
+from framing import LENGTH_HEADER, RECORD_DTYPE
+from tracking import ObjectType, TrackedObject
+
+logger = logging.getLogger(__name__)
+
+# tracker coordinates cover the aerial image scaled to 1280 pixels wide
+SCENE_SIZE = (1280.0, 975.0)
+
+# type -> (share of spawned objects, maximum speed in tracker pixels per second)
+TYPE_PROFILES: Dict[ObjectType, Tuple[float, float]] = {
+    ObjectType.PERSON: (0.25, 40.0),
+    ObjectType.BICYCLE: (0.06, 120.0),
+    ObjectType.CAR: (0.45, 300.0),
+    ObjectType.MOTORCYCLE: (0.04, 320.0),
+    ObjectType.BUS: (0.04, 220.0),
+    ObjectType.TRUCK: (0.08, 240.0),
+    ObjectType.TRAFFIC_LIGHT: (0.03, 0.0),
+    ObjectType.FIRE_HYDRANT: (0.02, 0.0),
+    ObjectType.STOP_SIGN: (0.02, 0.0),
+    ObjectType.PARKING_METER: (0.01, 0.0),
+}
+
+_TYPES = np.array([t.value for t in TYPE_PROFILES], dtype=np.int64)
+_SHARES = np.array([share for share, _ in TYPE_PROFILES.values()])
+_SHARES = _SHARES / _SHARES.sum()
+_MAX_SPEEDS = np.array([speed for _, speed in TYPE_PROFILES.values()])
+
+
+class TrafficSimulator:
+    """
+    Deterministic synthetic traffic in the tracker's 13-float wire format.
+    Moving objects enter at the scene edge heading inwards, cruise with smoothly
+    varying speed and turn rate, and are replaced by a new ID when they leave the
+    scene or, at `churn_per_s`, when the tracker would lose them. Each packet
+    omits `dropout` of the objects, like missed detections. Quadratic fits are
+    derived from the simulated motion (see `prediction.predict`).
+    """
+
+    def __init__(self, object_count: int = 200, seed: Optional[int] = None, churn_per_s: float = 0.02,
+                 dropout: float = 0.02, scene_size: Tuple[float, float] = SCENE_SIZE):
+        self.rng = np.random.default_rng(seed)
+        self.object_count = object_count
+        self.churn_per_s = churn_per_s
+        self.dropout = dropout
+        self.scene_size = scene_size
+        self.time = 0.0
+        self._next_id = 0
+        self.ids = np.zeros(object_count, dtype=np.int64)
+        self.position = np.zeros((object_count, 2))
+        self.heading = np.zeros(object_count)
+        self.speed = np.zeros(object_count)
+        self.max_speed = np.zeros(object_count)
+        self.turn_rate = np.zeros(object_count)
+        self.obj_type = np.zeros(object_count, dtype=np.int64)
+        self._spawn(np.arange(object_count), anywhere=True)
+
+    def _spawn(self, rows: np.ndarray, anywhere: bool = False):
+        count = len(rows)
+        if not count:
+            return
+        width, height = self.scene_size
+        self.ids[rows] = np.arange(self._next_id, self._next_id + count)
+        self._next_id += count
+        kind = self.rng.choice(len(_TYPES), size=count, p=_SHARES)
+        self.obj_type[rows] = _TYPES[kind]
+        self.max_speed[rows] = _MAX_SPEEDS[kind]
+        static = _MAX_SPEEDS[kind] == 0
+        position = self.rng.uniform((0, 0), (width, height), size=(count, 2))
+        # moving objects start on a random edge unless seeding the initial scene
+        edge_start = ~static & (not anywhere)
+        edge = self.rng.integers(0, 4, size=count)
+        position[edge_start & (edge == 0), 0] = 0
+        position[edge_start & (edge == 1), 0] = width
+        position[edge_start & (edge == 2), 1] = 0
+        position[edge_start & (edge == 3), 1] = height
+        self.position[rows] = position
+        # head roughly towards the centre of the scene (y points down, headings are counter-clockwise)
+        to_centre = np.arctan2(position[:, 1] - height / 2, width / 2 - position[:, 0])
+        self.heading[rows] = to_centre + self.rng.normal(0, 0.3, size=count)
+        self.speed[rows] = np.where(static, 0.0, self.max_speed[rows] * self.rng.uniform(0.3, 0.9, size=count))
+        self.turn_rate[rows] = 0.0
+
+    def step(self, dt: float) -> np.ndarray:
+        """Advance the scene by `dt` seconds and return the `(N, 13)` float32 packet.
+        """
+        count = self.object_count
+        moving = self.max_speed > 0
+        self.turn_rate = np.clip(self.turn_rate + self.rng.normal(0, 0.4 * np.sqrt(dt), count), -0.6, 0.6)
+        self.turn_rate[~moving] = 0.0
+        self.heading += self.turn_rate * dt
+        self.speed = np.clip(self.speed + self.rng.normal(0, 0.15 * np.sqrt(dt), count) * self.max_speed,
+                             0.0, self.max_speed)
+        self.position[:, 0] += self.speed * np.cos(self.heading) * dt
+        self.position[:, 1] -= self.speed * np.sin(self.heading) * dt
+        self.time += dt
+
+        width, height = self.scene_size
+        outside = ((self.position[:, 0] < 0) | (self.position[:, 0] > width)
+                   | (self.position[:, 1] < 0) | (self.position[:, 1] > height))
+        lost = moving & (self.rng.random(count) < self.churn_per_s * dt)
+        self._spawn(np.flatnonzero(outside | lost))
+        return self.packet()
+
+    def packet(self) -> np.ndarray:
+        visible = self.rng.random(self.object_count) >= self.dropout
+        cos, sin = np.cos(self.heading[visible]), np.sin(self.heading[visible])
+        speed = self.speed[visible]
+        turn = self.turn_rate[visible]
+        packet = np.empty((int(visible.sum()), TrackedObject.NP_ARRAY_SIZE), dtype=RECORD_DTYPE)
+        packet[:, 0] = self.ids[visible]
+        packet[:, 1:3] = self.position[visible]
+        packet[:, 3] = self.heading[visible]
+        packet[:, 4] = speed
+        packet[:, 5] = self.obj_type[visible]
+        packet[:, 6] = self.time
+        # x(t) = ax / 2 * t**2 + vx * t + x, with the acceleration due to turning
+        packet[:, 7] = -speed * sin * turn / 2
+        packet[:, 8] = speed * cos
+        packet[:, 9] = self.position[visible, 0]
+        packet[:, 10] = -speed * cos * turn / 2
+        packet[:, 11] = -speed * sin
+        packet[:, 12] = self.position[visible, 1]
+        return packet
+
+
+class SimulatorSource:
+    """
+    Frame source for :class:`~.VehicleTracker` producing simulated packets at `rate_hz`.
+    A `rate_hz` of 0 produces packets as fast as they are read, still advancing
+    the simulation by `1 / nominal_rate_hz` per packet.
+    """
+
+    def __init__(self, simulator: TrafficSimulator, rate_hz: float = 50.0, nominal_rate_hz: float = 50.0):
+        self.simulator = simulator
+        self.rate_hz = rate_hz
+        self.dt = 1 / (rate_hz or nominal_rate_hz)
+        self._next_at: Optional[float] = None
+
+    async def read_frame(self) -> np.ndarray:
+        if self.rate_hz:
+            loop = asyncio.get_event_loop()
+            now = loop.time()
+            if self._next_at is None or self._next_at < now - self.dt:
+                self._next_at = now
+            await asyncio.sleep(self._next_at - now)
+            self._next_at += self.dt
+        else:
+            await asyncio.sleep(0)
+        return self.simulator.step(self.dt)
+
+
+class SimulatorServer:
+    """
+    Streams simulated packets to every client connecting over TCP, like the real tracker.
+    """
+
+    MAX_BUFFERED_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, source: SimulatorSource, length_prefixed: bool = False):
+        self.source = source
+        self.length_prefixed = length_prefixed
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 7777):
+        self._server = await asyncio.start_server(self._on_connect, host, port)
+        self._task = asyncio.ensure_future(self._broadcast())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._server is not None:
+            self._server.close()
+        for writer in self._writers:
+            writer.close()
+
+    async def _on_connect(self, _reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+
+    async def _broadcast(self):
+        while True:
+            packet = (await self.source.read_frame()).tobytes()
+            if self.length_prefixed:
+                packet = LENGTH_HEADER.pack(len(packet)) + packet
+            for writer in list(self._writers):
+                if writer.is_closing():
+                    self._writers.discard(writer)
+                elif writer.transport.get_write_buffer_size() > self.MAX_BUFFERED_BYTES:
+                    logger.warning("Dropping slow simulator client")
+                    writer.close()
+                else:
+                    writer.write(packet)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve synthetic traffic in the tracker wire format.")
+    parser.add_argument('--objects', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=50.0, help="packets per second")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--length-prefixed', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    event_loop = asyncio.get_event_loop()
+    sim_server = SimulatorServer(SimulatorSource(TrafficSimulator(args.objects, seed=args.seed), args.rate),
+                                 length_prefixed=args.length_prefixed)
+    event_loop.run_until_complete(sim_server.start(args.host, args.port))
+    logger.info("Serving %d simulated objects on %s:%d", args.objects, args.host, args.port)
+    event_loop.run_forever()
@@ -0,0 +1,144 @@
+from typing import Callable, Mapping, Optional, Tuple
+
+import numpy as np
+
+from tracking import ObjectType, TrackedFrame
+
+DEFAULT_CELL_SIZE = 64
+
+
+class SpatialGrid:
+    """
+    Uniform grid over object locations, built once per tick, for finding the
+    objects in a rectangle without testing every object.
+    Rows are sorted by cell in column-major order, so the cells of one grid column
+    inside a rectangle form a single contiguous run of rows.
+    """
+
+    def __init__(self, location: np.ndarray, cell_size: int = DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        cells = location // cell_size
+        if len(cells):
+            self.origin = cells.min(axis=0)
+            cells -= self.origin
+            self.shape = cells.max(axis=0) + 1
+        else:
+            self.origin = np.zeros(2, dtype=np.int64)
+            self.shape = np.zeros(2, dtype=np.int64)
+        cell_ids = cells[:, 0] * self.shape[1] + cells[:, 1]
+        self._order = np.argsort(cell_ids, kind='stable')
+        self._sorted_cells = cell_ids[self._order]
+
+    def query(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Return the ascending row indices of the objects in cells overlapping the
+        rectangle. These are candidates: rows near the edges may lie outside it.
+        """
+        lo = np.floor_divide((x0, y0), self.cell_size).astype(np.int64) - self.origin
+        hi = np.floor_divide((x1, y1), self.cell_size).astype(np.int64) - self.origin
+        lo = np.maximum(lo, 0)
+        hi = np.minimum(hi, self.shape - 1)
+        if (hi < lo).any():
+            return np.empty(0, dtype=np.int64)
+        columns = np.arange(lo[0], hi[0] + 1) * self.shape[1]
+        starts = np.searchsorted(self._sorted_cells, columns + lo[1], side='left')
+        ends = np.searchsorted(self._sorted_cells, columns + hi[1], side='right')
+        rows = np.concatenate([self._order[start:end] for start, end in zip(starts, ends)])
+        rows.sort()
+        return rows
+
+
+def points_in_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """Even-odd test of `(N, 2)` points against a `(K, 2)` polygon, vectorised over the points.
+    """
+    x, y = points[:, 0].astype(np.float64), points[:, 1].astype(np.float64)
+    inside = np.zeros(len(points), dtype=bool)
+    for (ax, ay), (bx, by) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        crosses = (ay > y) != (by > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = ax + (y - ay) * (bx - ax) / (by - ay)
+        inside ^= crosses & (x < x_cross)
+    return inside
+
+
+def _parse_floats(value: str, name: str) -> np.ndarray:
+    try:
+        return np.array([float(v) for v in value.split(',')])
+    except ValueError:
+        raise ValueError(f"`{name}` must be a comma separated list of numbers") from None
+
+
+def _parse_type(value: str) -> int:
+    if value.isdigit():
+        return ObjectType(int(value)).value
+    try:
+        return ObjectType[value.upper()].value
+    except KeyError:
+        raise ValueError(f"Unknown object type {value!r}") from None
+
+
+def parse_types(value: str) -> Tuple[int, ...]:
+    """Parse a comma separated list of :class:`~.ObjectType` names or values, e.g. `car,person`.
+    Raises:
+        ValueError: If a type is unknown.
+    """
+    return tuple(_parse_type(v.strip()) for v in value.split(',') if v.strip())
+
+
+class RegionFilter:
+    """
+    A client's subscription to the objects inside a rectangle and/or polygon (in
+    map coordinates, like `TrackedFrame.location`) whose type is one of `types`.
+    Filters with equal `key`s select the same objects, so their results can be shared.
+    """
+
+    def __init__(self, bbox: Optional[Tuple[float, float, float, float]] = None,
+                 polygon: Optional[np.ndarray] = None, types: Optional[Tuple[int, ...]] = None):
+        self.polygon = None if polygon is None else np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        if self.polygon is not None:
+            poly_bbox = (*self.polygon.min(axis=0), *self.polygon.max(axis=0))
+            bbox = poly_bbox if bbox is None else (max(bbox[0], poly_bbox[0]), max(bbox[1], poly_bbox[1]),
+                                                   min(bbox[2], poly_bbox[2]), min(bbox[3], poly_bbox[3]))
+        self.bbox = None if bbox is None else tuple(float(v) for v in bbox)
+        self.types = None if types is None else tuple(sorted(set(types)))
+        self.key = (self.bbox, None if self.polygon is None else self.polygon.tobytes(), self.types)
+
+    @classmethod
+    def from_query(cls, params: Mapping[str, str]) -> Optional['RegionFilter']:
+        """Parse the `bbox=x0,y0,x1,y1`, `polygon=x0,y0,x1,y1,x2,y2,...` and
+        `types=car,person` (names or values of :class:`~.ObjectType`) query parameters.
+        Returns `None` if none are given.
+        Raises:
+            ValueError: If a parameter is malformed.
+        """
+        bbox = polygon = types = None
+        if 'bbox' in params:
+            bbox = _parse_floats(params['bbox'], 'bbox')
+            if len(bbox) != 4 or bbox[2] < bbox[0] or bbox[3] < bbox[1]:
+                raise ValueError("`bbox` must be x0,y0,x1,y1 with x0 <= x1 and y0 <= y1")
+        if 'polygon' in params:
+            polygon = _parse_floats(params['polygon'], 'polygon')
+            if len(polygon) < 6 or len(polygon) % 2:
+                raise ValueError("`polygon` must hold at least three x,y pairs")
+        if 'types' in params:
+            types = parse_types(params['types'])
+        if bbox is None and polygon is None and types is None:
+            return None
+        return cls(bbox=None if bbox is None else tuple(bbox), polygon=polygon, types=types)
+
+    def apply(self, frame: TrackedFrame, grid: Callable[[], SpatialGrid]) -> TrackedFrame:
+        """Return the objects of `frame` matching the filter. `grid` returns the spatial
+        index of `frame`, and is only called if the filter has a region.
+        """
+        if self.bbox is None:
+            rows = np.arange(len(frame))
+        else:
+            x0, y0, x1, y1 = self.bbox
+            rows = grid().query(x0, y0, x1, y1)
+            location = frame.location[rows]
+            rows = rows[(location[:, 0] >= x0) & (location[:, 0] <= x1)
+                        & (location[:, 1] >= y0) & (location[:, 1] <= y1)]
+            if self.polygon is not None:
+                rows = rows[points_in_polygon(frame.location[rows], self.polygon)]
+        if self.types is not None:
+            rows = rows[np.isin(frame.obj_type[rows], self.types)]
+        return frame.take(rows)
@@ -0,0 +1,39 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from broadcast import decode_tracking, tracking_channel
+from feeds import FeedConfig, load_feeds
+from server import TrackerManager
+from tracking import POS_SCALE, TrackedFrame
+
+
+def test_invalid_prediction_settings_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        FeedConfig('pub', broadcast_delay_s=1.0, prediction_lead_s=2.0)
+    with pytest.raises(ValueError):
+        FeedConfig('pub', output_rate_hz=0)
+    path = tmp_path / 'feeds.json'
+    path.write_text('{"pub": {"prediction_lead_s": -1}}')
+    with pytest.raises(ValueError, match="pub"):
+        load_feeds(str(path))
+
+
+def test_feed_with_prediction_lead_broadcasts_extrapolated_positions():
+    async def run():
+        manager = TrackerManager()
+        tracker = manager.add_feed(FeedConfig('pub', broadcast_delay_s=3.0, prediction_lead_s=0.5))
+        assert tracker.delay_line.delay_s == pytest.approx(2.5)
+        subscription = manager.backend.subscribe(tracking_channel('pub'))
+        # id, x, y, rotation, speed, type, timestamp, then x and y fits
+        record = np.array([[7, 100, 200, 0, 0, 2, 10.0, 4, 20, 0, 0, 0, 0]])
+        await tracker.predictor.update(TrackedFrame.from_np(record), 0.1)
+        frame, _ = decode_tracking(await asyncio.wait_for(subscription.__anext__(), 1))
+        return frame
+
+    frame = asyncio.run(run())
+    shift = (4 * 0.5 ** 2 + 20 * 0.5) * POS_SCALE
+    assert frame.location[0, 0] == round(int(100 * POS_SCALE) + shift)
+    assert frame.location[0, 1] == int(200 * POS_SCALE)
+    assert frame.timestamp[0] == pytest.approx(10.5)
@@ -0,0 +1,28 @@
+import asyncio
+import logging
+
+from server import TrackerManager
+
+
+def test_stop_gives_up_on_tasks_that_ignore_cancellation(caplog):
+    async def stubborn():
+        while True:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                pass
+
+    async def run():
+        manager = TrackerManager()
+        manager.STOP_TIMEOUT_S = 0.1
+        await manager.start()
+        task = asyncio.ensure_future(stubborn())
+        manager._tasks['pub'] = task
+        await asyncio.sleep(0)
+        await asyncio.wait_for(manager.stop(), 2)
+        assert not task.done()
+        task.cancel()
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(run())
+    assert "did not stop" in caplog.text and "pub" in caplog.text
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+import projection
+from projection import CameraProjection, undistort_normalised
+
+CAMERA_MATRIX = np.array([[1000.0, 0, 960], [0, 1000, 540], [0, 0, 1]])
+DIST_COEFFS = np.array([-0.2, 0.05, 0.001, -0.002, 0.01])
+HOMOGRAPHY = np.array([[0.8, 0.1, 20], [-0.05, 0.9, 40], [1e-4, 2e-4, 1]])
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    return np.stack((rng.uniform(200, 1720, 500), rng.uniform(100, 980, 500)), axis=1)
+
+
+def test_transform_tools_copy_is_identical():
+    here = os.path.dirname(os.path.abspath(projection.__file__))
+    with open(os.path.join(here, 'projection.py')) as source, \
+            open(os.path.join(here, os.pardir, 'transform', 'projection.py')) as copy:
+        assert copy.read() == source.read(), "copy backend/projection.py to transform/projection.py"
+
+
+def test_undistort_matches_opencv(points):
+    cv2 = pytest.importorskip('cv2')
+    expected = cv2.undistortPoints(points.reshape(-1, 1, 2), CAMERA_MATRIX, DIST_COEFFS).reshape(-1, 2)
+    np.testing.assert_allclose(undistort_normalised(points, CAMERA_MATRIX, DIST_COEFFS), expected, atol=1e-9)
+
+
+@pytest.mark.parametrize('correction', [True, False])
+def test_derivative_matches_finite_differences(points, monkeypatch, correction):
+    # converge the undistortion fully, so finite differences are exact enough to compare against
+    monkeypatch.setattr(projection, 'UNDISTORT_ITERATIONS', 100)
+    camera = CameraProjection(HOMOGRAPHY, CAMERA_MATRIX if correction else None, DIST_COEFFS, (1920, 1080))
+    position, derivative, _ = camera._map_with_derivative(points, np.empty((0, 2)))
+    step = 1e-4
+    numeric = np.stack([(camera.to_map(points + offset) - camera.to_map(points - offset)) / (2 * step)
+                        for offset in ([step, 0], [0, step])], axis=2)
+    np.testing.assert_allclose(position, camera.to_map(points))
+    np.testing.assert_allclose(derivative, numeric, rtol=1e-5, atol=1e-8)
+
+
+def test_project_records_maps_velocity_through_derivative(points):
+    camera = CameraProjection(HOMOGRAPHY, CAMERA_MATRIX, DIST_COEFFS, (1920, 1080))
+    records = np.zeros((len(points), projection.RECORD_SIZE))
+    records[:, 1:3] = points
+    records[:, 3] = 0.3
+    records[:, 4] = 10
+    projected = camera.project_records(records)
+    _, derivative, _ = camera._map_with_derivative(points, np.empty((0, 2)))
+    vel = derivative @ np.array([10 * np.cos(0.3), -10 * np.sin(0.3)])
+    np.testing.assert_allclose(projected[:, 1:3], camera.to_map(points))
+    np.testing.assert_allclose(projected[:, 4], np.hypot(vel[:, 0], vel[:, 1]))
+    np.testing.assert_allclose(projected[:, 3], np.arctan2(-vel[:, 1], vel[:, 0]))
+    # records without a trajectory fit keep zero coefficients
+    assert not projected[:, 7:13].any()
@@ -0,0 +1,321 @@
+import enum
+import math
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+import numpy as np
+from dataclasses_json import dataclass_json, LetterCase
+
+
+class ObjectType(enum.IntEnum):
+    PERSON = 0
+    BICYCLE = 1
+    CAR = 2
+    MOTORCYCLE = 3
+    BUS = 5
+    TRUCK = 7
+    TRAFFIC_LIGHT = 9
+    FIRE_HYDRANT = 10
+    STOP_SIGN = 11
+    PARKING_METER = 12
+
+
+_VALID_TYPES = np.array([t.value for t in ObjectType], dtype=np.int64)
+
+# Binary TRACKING message: a header followed by one row of BINARY_RECORD_SIZE
+# 4 byte values per object: the uint32 id, then float32 x, y, rotation, vx, vy,
+# type, xa, xb, xc, ya, yb, yc, timestamp.
+# A TRACKING_DELTA message inserts a uint32 count and the uint32 IDs of removed
+# objects between the header and the records of added/changed objects.
+# With BINARY_FLAG_BASIC set the coefficients are left out, giving records of
+# BINARY_BASIC_RECORD_SIZE values: id, x, y, rotation, vx, vy, type, timestamp.
+# IDs are checked to fit in a uint32 by `TrackedFrame.from_np`; version 1 sent
+# them as float32, so IDs above 2**24 collided.
+BINARY_VERSION = 2
+MAX_OBJECT_ID = 2 ** 32 - 1
+BINARY_TRACKING = 1
+BINARY_TRACKING_DELTA = 2
+BINARY_HEADER = struct.Struct('<BBHId')  # version, message type, flags, object count, tick time
+BINARY_COUNT = struct.Struct('<I')
+BINARY_RECORD_SIZE = 14
+BINARY_FLAG_BASIC = 1
+BINARY_BASIC_RECORD_SIZE = 8
+
+# lossless column layout of `TrackedFrame.to_buffer`, after a uint32 object count
+_BUFFER_COUNT = struct.Struct('<I')
+_BUFFER_COLUMNS = (('ids', '<i8', ()), ('location', '<i8', (2,)), ('rotation', '<f8', ()), ('vel', '<f8', (2,)),
+                   ('obj_type', '<i8', ()), ('x_coeffs', '<f8', (3,)), ('y_coeffs', '<f8', (3,)),
+                   ('timestamp', '<f8', ()))
+
+POS_SCALE = 1062 / 1280
+X_OFFSET = 0
+Y_OFFSET = 0
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class TrackedObject:
+    location: Tuple[int, int]
+    rotation: int
+    vel: Tuple[float, float]
+    obj_type: ObjectType
+    x_coeffs: Tuple[float, float, float]
+    y_coeffs: Tuple[float, float, float]
+    timestamp: float
+
+    NP_ARRAY_SIZE = 13
+
+    @classmethod
+    def from_np(cls, np_array: np.array):
+        [obj_id, x, y, rot, speed, typ, t_stamp, xa, xb, xc, ya, yb, yc] = map(float, np_array)
+        vel = (speed * math.cos(rot) * POS_SCALE, -speed * math.sin(rot) * POS_SCALE)
+        return int(obj_id), cls(obj_type=ObjectType(int(typ)),
+                                location=(int(x * POS_SCALE) + X_OFFSET, int(y * POS_SCALE) + Y_OFFSET),
+                                timestamp=t_stamp, vel=vel, rotation=math.pi / 2 - rot,
+                                x_coeffs=(xa, xb, xc), y_coeffs=(ya, yb, yc))
+
+
+class TrackedFrame:
+    """
+    Columnar (struct-of-arrays) set of tracked objects, keyed by object ID.
+    Row `i` of every column describes the object `ids[i]`. Frames are treated as
+    immutable, so they can be shared between the tracker and broadcasts without
+    copying. :class:`~.TrackedObject` instances are only built on demand.
+    """
+
+    __slots__ = ('ids', 'location', 'rotation', 'vel', 'obj_type', 'x_coeffs', 'y_coeffs', 'timestamp',
+                 '_objects')
+
+    ids: np.ndarray
+    location: np.ndarray
+    rotation: np.ndarray
+    vel: np.ndarray
+    obj_type: np.ndarray
+    x_coeffs: np.ndarray
+    y_coeffs: np.ndarray
+    timestamp: np.ndarray
+
+    def __init__(self, ids: np.ndarray, location: np.ndarray, rotation: np.ndarray, vel: np.ndarray,
+                 obj_type: np.ndarray, x_coeffs: np.ndarray, y_coeffs: np.ndarray, timestamp: np.ndarray):
+        self.ids = ids
+        self.location = location
+        self.rotation = rotation
+        self.vel = vel
+        self.obj_type = obj_type
+        self.x_coeffs = x_coeffs
+        self.y_coeffs = y_coeffs
+        self.timestamp = timestamp
+        self._objects: Optional[Dict[int, TrackedObject]] = None
+
+    @classmethod
+    def empty(cls) -> 'TrackedFrame':
+        return cls(ids=np.empty(0, dtype=np.int64), location=np.empty((0, 2), dtype=np.int64),
+                   rotation=np.empty(0), vel=np.empty((0, 2)), obj_type=np.empty(0, dtype=np.int64),
+                   x_coeffs=np.empty((0, 3)), y_coeffs=np.empty((0, 3)), timestamp=np.empty(0))
+
+    @classmethod
+    def from_np(cls, np_array: np.ndarray) -> 'TrackedFrame':
+        """Decode an `(N, 13)` array of raw tracker records in one pass.
+        Produces the same values as calling :meth:`TrackedObject.from_np` on every
+        row. When an ID occurs more than once, its last record wins.
+        Raises:
+            ValueError: If the array has the wrong shape, or contains an unknown object type or
+                an ID outside the uint32 range of the binary encoding.
+        """
+        if np_array.ndim != 2 or np_array.shape[1] != TrackedObject.NP_ARRAY_SIZE:
+            raise ValueError(f"Expected an (N, {TrackedObject.NP_ARRAY_SIZE}) array, got {np_array.shape}")
+        rows = np_array.astype(np.float64)
+
+        obj_type = rows[:, 5].astype(np.int64)
+        invalid = ~np.isin(obj_type, _VALID_TYPES)
+        if invalid.any():
+            raise ValueError(f"{int(obj_type[invalid][0])} is not a valid ObjectType")
+
+        ids = rows[:, 0].astype(np.int64)
+        invalid = (ids < 0) | (ids > MAX_OBJECT_ID)
+        if invalid.any():
+            raise ValueError(f"{int(ids[invalid][0])} is not a valid object ID")
+        rot = rows[:, 3]
+        speed = rows[:, 4]
+        location = np.empty((len(rows), 2), dtype=np.int64)
+        location[:, 0] = (rows[:, 1] * POS_SCALE).astype(np.int64) + X_OFFSET
+        location[:, 1] = (rows[:, 2] * POS_SCALE).astype(np.int64) + Y_OFFSET
+        vel = np.empty((len(rows), 2))
+        vel[:, 0] = speed * np.cos(rot) * POS_SCALE
+        vel[:, 1] = -speed * np.sin(rot) * POS_SCALE
+
+        frame = cls(ids=ids, location=location, rotation=math.pi / 2 - rot, vel=vel, obj_type=obj_type,
+                    x_coeffs=rows[:, 7:10], y_coeffs=rows[:, 10:13], timestamp=rows[:, 6])
+        unique_ids, first = np.unique(ids, return_index=True)
+        if len(unique_ids) != len(ids):
+            # like building a dict: first position of every ID, last record wins
+            _, last = np.unique(ids[::-1], return_index=True)
+            frame = frame.take((len(ids) - 1 - last)[np.argsort(first)])
+        return frame
+
+    @classmethod
+    def from_objects(cls, objects: Dict[int, TrackedObject]) -> 'TrackedFrame':
+        if not objects:
+            return cls.empty()
+        values = list(objects.values())
+        return cls(ids=np.fromiter(objects.keys(), dtype=np.int64, count=len(objects)),
+                   location=np.array([o.location for o in values], dtype=np.int64),
+                   rotation=np.array([o.rotation for o in values], dtype=np.float64),
+                   vel=np.array([o.vel for o in values], dtype=np.float64),
+                   obj_type=np.array([int(o.obj_type) for o in values], dtype=np.int64),
+                   x_coeffs=np.array([o.x_coeffs for o in values], dtype=np.float64),
+                   y_coeffs=np.array([o.y_coeffs for o in values], dtype=np.float64),
+                   timestamp=np.array([o.timestamp for o in values], dtype=np.float64))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids.tolist())
+
+    def __contains__(self, obj_id: int) -> bool:
+        return obj_id in self.objects()
+
+    def __getitem__(self, obj_id: int) -> TrackedObject:
+        return self.objects()[obj_id]
+
+    def items(self):
+        return self.objects().items()
+
+    def values(self):
+        return self.objects().values()
+
+    def take(self, indices: np.ndarray) -> 'TrackedFrame':
+        """Return a new frame holding the selected rows (index array or boolean mask).
+        """
+        return TrackedFrame(ids=self.ids[indices], location=self.location[indices],
+                            rotation=self.rotation[indices], vel=self.vel[indices],
+                            obj_type=self.obj_type[indices], x_coeffs=self.x_coeffs[indices],
+                            y_coeffs=self.y_coeffs[indices], timestamp=self.timestamp[indices])
+
+    def merge(self, newer: 'TrackedFrame') -> 'TrackedFrame':
+        """Return a frame with the rows of `newer` replacing any rows with the same ID in this frame.
+        """
+        if not len(self):
+            return newer
+        if not len(newer):
+            return self
+        kept = self.take(~np.isin(self.ids, newer.ids))
+        return TrackedFrame(ids=np.concatenate((kept.ids, newer.ids)),
+                            location=np.concatenate((kept.location, newer.location)),
+                            rotation=np.concatenate((kept.rotation, newer.rotation)),
+                            vel=np.concatenate((kept.vel, newer.vel)),
+                            obj_type=np.concatenate((kept.obj_type, newer.obj_type)),
+                            x_coeffs=np.concatenate((kept.x_coeffs, newer.x_coeffs)),
+                            y_coeffs=np.concatenate((kept.y_coeffs, newer.y_coeffs)),
+                            timestamp=np.concatenate((kept.timestamp, newer.timestamp)))
+
+    def objects(self) -> Dict[int, TrackedObject]:
+        """Materialise (and cache) a :class:`~.TrackedObject` for every row.
+        """
+        if self._objects is None:
+            self._objects = {
+                obj_id: TrackedObject(location=tuple(loc), rotation=rot, vel=tuple(vel),
+                                      obj_type=ObjectType(typ), x_coeffs=tuple(xc), y_coeffs=tuple(yc),
+                                      timestamp=ts)
+                for obj_id, loc, rot, vel, typ, xc, yc, ts in zip(
+                    self.ids.tolist(), self.location.tolist(), self.rotation.tolist(), self.vel.tolist(),
+                    self.obj_type.tolist(), self.x_coeffs.tolist(), self.y_coeffs.tolist(),
+                    self.timestamp.tolist())
+            }
+        return self._objects
+
+    def diff(self, newer: 'TrackedFrame', position_threshold: float, velocity_threshold: float,
+             rotation_threshold: float) -> Tuple['TrackedFrame', np.ndarray]:
+        """Compare `newer` against this frame.
+        Returns the rows of `newer` that are new or have moved, turned or changed
+        velocity or type by more than the given thresholds, and the IDs that are no
+        longer present.
+        """
+        removed = self.ids[~np.isin(self.ids, newer.ids)]
+        if not len(self):
+            return newer, removed
+        order = np.argsort(self.ids)
+        sorted_ids = self.ids[order]
+        pos = np.minimum(np.searchsorted(sorted_ids, newer.ids), len(sorted_ids) - 1)
+        matched = sorted_ids[pos] == newer.ids
+        old = order[pos[matched]]
+        changed = ~matched
+        # headings wrap at +-pi, so compare the shortest angle between them
+        turned = np.abs((newer.rotation[matched] - self.rotation[old] + math.pi) % (2 * math.pi) - math.pi)
+        changed[matched] = ((np.abs(newer.location[matched] - self.location[old]).max(axis=1) > position_threshold)
+                            | (np.abs(newer.vel[matched] - self.vel[old]).max(axis=1) > velocity_threshold)
+                            | (turned > rotation_threshold)
+                            | (newer.obj_type[matched] != self.obj_type[old]))
+        return newer.take(changed), removed
+
+    def to_binary(self, tick_time: float, removed: Optional[np.ndarray] = None, basic: bool = False) -> bytes:
+        """Pack the frame into a binary TRACKING message (see `BINARY_HEADER`), or
+        into a TRACKING_DELTA message if the `removed` IDs are given. `basic`
+        leaves out the polynomial coefficients.
+        """
+        records = np.empty((len(self), BINARY_BASIC_RECORD_SIZE if basic else BINARY_RECORD_SIZE), dtype='<f4')
+        records.view('<u4')[:, 0] = self.ids
+        records[:, 1:3] = self.location
+        records[:, 3] = self.rotation
+        records[:, 4:6] = self.vel
+        records[:, 6] = self.obj_type
+        if basic:
+            records[:, 7] = self.timestamp
+        else:
+            records[:, 7:10] = self.x_coeffs
+            records[:, 10:13] = self.y_coeffs
+            records[:, 13] = self.timestamp
+        flags = BINARY_FLAG_BASIC if basic else 0
+        if removed is None:
+            return BINARY_HEADER.pack(BINARY_VERSION, BINARY_TRACKING, flags, len(self), tick_time) + records.tobytes()
+        return b''.join((BINARY_HEADER.pack(BINARY_VERSION, BINARY_TRACKING_DELTA, flags, len(self), tick_time),
+                         BINARY_COUNT.pack(len(removed)), removed.astype('<u4').tobytes(), records.tobytes()))
+
+    def to_buffer(self) -> bytes:
+        """Serialise every column losslessly, for passing frames between processes.
+        """
+        return b''.join([_BUFFER_COUNT.pack(len(self))] + [
+            np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes() for name, dtype, _ in _BUFFER_COLUMNS])
+
+    @classmethod
+    def from_buffer(cls, data: Union[bytes, memoryview]) -> 'TrackedFrame':
+        """Rebuild a frame written by :meth:`to_buffer`, with columns viewing `data` without copying.
+        Raises:
+            ValueError: If `data` is not a complete buffer.
+        """
+        if len(data) < _BUFFER_COUNT.size:
+            raise ValueError("Truncated frame buffer")
+        (count,) = _BUFFER_COUNT.unpack_from(data)
+        offset = _BUFFER_COUNT.size
+        columns = {}
+        for name, dtype, shape in _BUFFER_COLUMNS:
+            size = count * int(np.prod(shape, dtype=np.int64))
+            if offset + size * 8 > len(data):
+                raise ValueError("Truncated frame buffer")
+            columns[name] = np.frombuffer(data, dtype=dtype, count=size, offset=offset).reshape((count,) + shape)
+            offset += size * 8
+        if offset != len(data):
+            raise ValueError(f"Frame buffer has {len(data) - offset} trailing bytes")
+        return cls(**columns)
+
+    def to_dict(self, basic: bool = False) -> Dict[int, dict]:
+        """Return the JSON-ready mapping produced by calling `to_dict` on every object,
+        without building any :class:`~.TrackedObject`. `basic` leaves out the
+        polynomial coefficients.
+        """
+        if basic:
+            return {
+                obj_id: {"location": loc, "rotation": rot, "vel": vel, "objType": typ, "timestamp": ts}
+                for obj_id, loc, rot, vel, typ, ts in zip(
+                    self.ids.tolist(), self.location.tolist(), self.rotation.tolist(), self.vel.tolist(),
+                    self.obj_type.tolist(), self.timestamp.tolist())
+            }
+        return {
+            obj_id: {"location": loc, "rotation": rot, "vel": vel, "objType": typ, "xCoeffs": xc, "yCoeffs": yc,
+                     "timestamp": ts}
+            for obj_id, loc, rot, vel, typ, xc, yc, ts in zip(
+                self.ids.tolist(), self.location.tolist(), self.rotation.tolist(), self.vel.tolist(),
+                self.obj_type.tolist(), self.x_coeffs.tolist(), self.y_coeffs.tolist(), self.timestamp.tolist())
+        }
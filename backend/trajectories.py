@@ -0,0 +1,289 @@
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tracking import TrackedFrame
+
+logger = logging.getLogger(__name__)
+
+# A store is a directory of segments, each covering `segment_s` seconds and named
+# after its start time. A segment holds one append-only file per column, with a
+# row per object per tick, and a tick index of (time, first row, row count).
+# Once a segment is complete, an object index of the first and last row of every
+# object ID, sorted by ID, is added.
+COLUMNS: Dict[str, np.dtype] = {
+    'time': np.dtype('<f8'),
+    'id': np.dtype('<i8'),
+    'x': np.dtype('<f4'),
+    'y': np.dtype('<f4'),
+    'vx': np.dtype('<f4'),
+    'vy': np.dtype('<f4'),
+    'rotation': np.dtype('<f4'),
+    'type': np.dtype('u1'),
+}
+INDEX_FILE = 'index'
+INDEX_DTYPE = np.dtype([('time', '<f8'), ('offset', '<i8'), ('count', '<i8')])
+OBJECTS_FILE = 'objects'
+OBJECTS_DTYPE = np.dtype([('id', '<i8'), ('first_row', '<i8'), ('last_row', '<i8')])
+
+
+def _frame_columns(frame: TrackedFrame, t: float) -> Dict[str, np.ndarray]:
+    return {
+        'time': np.full(len(frame), t, dtype=COLUMNS['time']),
+        'id': frame.ids,
+        'x': frame.location[:, 0],
+        'y': frame.location[:, 1],
+        'vx': frame.vel[:, 0],
+        'vy': frame.vel[:, 1],
+        'rotation': frame.rotation,
+        'type': frame.obj_type,
+    }
+
+
+class _SegmentWriter:
+
+    def __init__(self, path: str, start: float):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.start = start
+        # a reopened segment is incomplete again, so queries must not trust its old object index
+        try:
+            os.remove(os.path.join(path, OBJECTS_FILE))
+        except FileNotFoundError:
+            pass
+        self._files = {name: open(os.path.join(path, name), 'ab') for name in COLUMNS}
+        self._index = open(os.path.join(path, INDEX_FILE), 'ab')
+        self._offset = self._truncate_to_index()
+
+    def _truncate_to_index(self) -> int:
+        """Cut the columns and tick index back to the last complete tick, dropping any
+        partial write left by a crash, and return the number of rows.
+        """
+        rows = min(os.path.getsize(os.path.join(self.path, name)) // dtype.itemsize for name, dtype in COLUMNS.items())
+        index_path = os.path.join(self.path, INDEX_FILE)
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE, count=os.path.getsize(index_path) // INDEX_DTYPE.itemsize)
+        ends = index['offset'] + index['count']
+        ticks = int(np.searchsorted(ends, rows, side='right'))
+        rows = int(ends[ticks - 1]) if ticks else 0
+        os.truncate(index_path, ticks * INDEX_DTYPE.itemsize)
+        for name, dtype in COLUMNS.items():
+            os.truncate(os.path.join(self.path, name), rows * dtype.itemsize)
+        return rows
+
+    def write(self, columns: Dict[str, np.ndarray], t: float):
+        count = len(columns['id'])
+        for name, dtype in COLUMNS.items():
+            self._files[name].write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        # the index entry goes last, so readers never see a tick whose rows are incomplete
+        for f in self._files.values():
+            f.flush()
+        self._index.write(np.array([(t, self._offset, count)], dtype=INDEX_DTYPE).tobytes())
+        self._index.flush()
+        self._offset += count
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._index.close()
+        ids = np.fromfile(os.path.join(self.path, 'id'), dtype=COLUMNS['id'])
+        unique_ids, first = np.unique(ids, return_index=True)
+        _, last_reversed = np.unique(ids[::-1], return_index=True)
+        objects = np.empty(len(unique_ids), dtype=OBJECTS_DTYPE)
+        objects['id'] = unique_ids
+        objects['first_row'] = first
+        objects['last_row'] = len(ids) - 1 - last_reversed
+        tmp_path = os.path.join(self.path, OBJECTS_FILE + '.tmp')
+        objects.tofile(tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, OBJECTS_FILE))
+
+
+class TrajectoryStore:
+    """
+    Append-only, time-partitioned columnar store of every tracked object's position,
+    sampled at most every `min_interval_s` and kept for `retention_s`.
+    Frames are handed to a writer thread, so appending never blocks the event loop;
+    if the writer falls `max_pending` frames behind, new frames are dropped.
+    Queries binary search the tick index of each segment overlapping the time window,
+    narrow the rows further with the object index when querying by ID, and read only
+    the remaining row range of the memory mapped columns.
+    """
+
+    def __init__(self, root: str, segment_s: float = 300.0, retention_s: float = 24 * 3600.0,
+                 min_interval_s: float = 0.1, max_pending: int = 512):
+        self.root = root
+        self.segment_s = segment_s
+        self.retention_s = retention_s
+        self.min_interval_s = min_interval_s
+        self._last_appended = float('-inf')
+        os.makedirs(root, exist_ok=True)
+        self._queue: 'queue.Queue[Optional[Tuple[TrackedFrame, float]]]' = queue.Queue(max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._writer: Optional[_SegmentWriter] = None
+        self.dropped = 0
+
+    def append(self, frame: TrackedFrame, t: Optional[float] = None):
+        """Queue a frame observed at UNIX time `t` (default now) for writing, unless
+        the last frame was written less than `min_interval_s` earlier.
+        """
+        t = time.time() if t is None else t
+        if 0 <= t - self._last_appended < self.min_interval_s:
+            return
+        self._last_appended = t
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._write_loop, name=f"trajectories {self.root}", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait((frame, t))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frame, t = item
+            try:
+                self._write(frame, t)
+            except OSError:
+                logger.exception("Failed to write trajectories to %s", self.root)
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _write(self, frame: TrackedFrame, t: float):
+        if self._writer is None or t >= self._writer.start + self.segment_s or t < self._writer.start:
+            if self._writer is not None:
+                self._writer.close()
+            start = t - t % self.segment_s
+            self._writer = _SegmentWriter(self._segment_path(start), start)
+            self.enforce_retention(t)
+        self._writer.write(_frame_columns(frame, t), t)
+
+    def _segment_path(self, start: float) -> str:
+        return os.path.join(self.root, f"{int(start):012d}")
+
+    def segments(self) -> List[float]:
+        """Return the start times of all segments, ascending.
+        """
+        return sorted(float(name) for name in os.listdir(self.root) if name.isdigit())
+
+    def enforce_retention(self, now: Optional[float] = None):
+        """Delete segments that ended more than `retention_s` before `now`.
+        """
+        cutoff = (time.time() if now is None else now) - self.retention_s
+        for start in self.segments():
+            if start + self.segment_s < cutoff:
+                shutil.rmtree(self._segment_path(start), ignore_errors=True)
+
+    def extent(self) -> Optional[Tuple[float, float]]:
+        """Return the time of the first and last stored ticks, or `None` if empty.
+        """
+        first = last = None
+        for start in self.segments():
+            index = self._read_index(self._segment_path(start))
+            if len(index):
+                first = float(index['time'][0]) if first is None else first
+                last = float(index['time'][-1])
+        return None if first is None else (first, last)
+
+    @staticmethod
+    def _read_index(path: str) -> np.ndarray:
+        try:
+            return np.fromfile(os.path.join(path, INDEX_FILE), dtype=INDEX_DTYPE)
+        except FileNotFoundError:
+            return np.empty(0, dtype=INDEX_DTYPE)
+
+    @staticmethod
+    def _object_rows(path: str, ids: np.ndarray) -> Optional[Tuple[int, int]]:
+        """Return the row range spanning all of `ids` in a complete segment, `(0, 0)` if
+        none of them occur, or `None` if the segment has no object index yet.
+        """
+        try:
+            objects = np.fromfile(os.path.join(path, OBJECTS_FILE), dtype=OBJECTS_DTYPE)
+        except FileNotFoundError:
+            return None
+        if not len(objects):
+            return 0, 0
+        positions = np.minimum(np.searchsorted(objects['id'], ids), len(objects) - 1)
+        found = objects[positions[objects['id'][positions] == ids]]
+        if not len(found):
+            return 0, 0
+        return int(found['first_row'].min()), int(found['last_row'].max()) + 1
+
+    def query(self, start: float, end: float, ids: Optional[Sequence[int]] = None,
+              types: Optional[Sequence[int]] = None, max_rows: int = 5_000_000) -> Dict[str, np.ndarray]:
+        """Return the columns of every stored row with `start <= time < end`, optionally
+        restricted to the given object IDs and types, ordered by time.
+        Raises:
+            ValueError: If the window is empty, or more than `max_rows` rows would be read.
+        """
+        if end <= start:
+            raise ValueError("The query window must end after it starts")
+        ids = None if ids is None else np.unique(np.asarray(ids, dtype=np.int64))
+        parts: List[Dict[str, np.ndarray]] = []
+        scanned = 0
+        for segment_start in self.segments():
+            if segment_start >= end or segment_start + self.segment_s <= start:
+                continue
+            path = self._segment_path(segment_start)
+            index = self._read_index(path)
+            first, last = np.searchsorted(index['time'], (start, end), side='left')
+            if first == last:
+                continue
+            row_start = int(index['offset'][first])
+            row_end = int(index['offset'][last - 1] + index['count'][last - 1])
+            if ids is not None and (object_rows := self._object_rows(path, ids)) is not None:
+                row_start, row_end = max(row_start, object_rows[0]), min(row_end, object_rows[1])
+            if row_end <= row_start:
+                continue
+            scanned += row_end - row_start
+            if scanned > max_rows:
+                raise ValueError(f"Query would read more than {max_rows} rows, narrow the time window")
+            columns = {name: np.memmap(os.path.join(path, name), dtype=dtype, mode='r',
+                                       offset=row_start * dtype.itemsize, shape=(row_end - row_start,))
+                       for name, dtype in COLUMNS.items()}
+            mask = None
+            if ids is not None:
+                mask = np.isin(columns['id'], ids)
+            if types is not None:
+                type_mask = np.isin(columns['type'], types)
+                mask = type_mask if mask is None else mask & type_mask
+            parts.append({name: np.array(column if mask is None else column[mask])
+                          for name, column in columns.items()})
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+    def trajectories(self, start: float, end: float, ids: Optional[Sequence[int]] = None,
+                     types: Optional[Sequence[int]] = None, max_rows: int = 5_000_000) -> Dict[int, dict]:
+        """Group the rows returned by :meth:`query` into a JSON-ready trajectory per object.
+        """
+        rows = self.query(start, end, ids, types, max_rows)
+        order = np.argsort(rows['id'], kind='stable')
+        sorted_ids = rows['id'][order]
+        unique_ids, first = np.unique(sorted_ids, return_index=True)
+        bounds = np.append(first, len(order))
+        result = {}
+        for i, obj_id in enumerate(unique_ids.tolist()):
+            rows_i = order[bounds[i]:bounds[i + 1]]
+            result[obj_id] = {
+                "objType": int(rows['type'][rows_i[-1]]),
+                "time": rows['time'][rows_i].tolist(),
+                "location": np.stack((rows['x'][rows_i], rows['y'][rows_i]), axis=1).tolist(),
+                "vel": np.stack((rows['vx'][rows_i], rows['vy'][rows_i]), axis=1).tolist(),
+                "rotation": rows['rotation'][rows_i].tolist(),
+            }
+        return result
@@ -23,7 +23,10 @@ displayHolder.appendChild(app.view); // Create Canvas tag in the body
 let detections = {};
 let sprites = {};
 let heatMapSprites = [];
+// delta updates only carry changed objects, so staleness is judged by the last message of the feed
+let lastMessageAt = 0;
 const SPRITE_TIMEOUT_MS = 500;
+const RECONNECT_MS = 1000;
 const bgSprite = Sprite.from(aerial);
 
 function makeSprite(label) {
@@ -72,6 +75,57 @@ function makeBlurSprite(alpha) {
 }
 
 
+// Binary TRACKING frames (see backend/tracking.py): a 16 byte header
+// (version, type, reserved, object count, tick time) followed by
+// 14 values per object: a uint32 ID and 13 float32 values. TRACKING_DELTA
+// frames insert a uint32 count and the uint32 IDs of removed objects
+// before the records.
+const BINARY_HEADER_SIZE = 16;
+const BINARY_RECORD_SIZE = 14;
+const BINARY_BASIC_RECORD_SIZE = 8;
+const BINARY_FLAG_BASIC = 1;
+const BINARY_TRACKING_DELTA = 2;
+
+function decodeBinaryTracking(buffer) {
+    const view = new DataView(buffer);
+    const isDelta = view.getUint8(1) === BINARY_TRACKING_DELTA;
+    const basic = (view.getUint16(2, true) & BINARY_FLAG_BASIC) !== 0;
+    const recordSize = basic ? BINARY_BASIC_RECORD_SIZE : BINARY_RECORD_SIZE;
+    const count = view.getUint32(4, true);
+    const tickTime = view.getFloat64(8, true);
+    let offset = BINARY_HEADER_SIZE;
+    let removed = [];
+    if (isDelta) {
+        const removedCount = view.getUint32(offset, true);
+        removed = Array.from(new Uint32Array(buffer, offset + 4, removedCount));
+        offset += 4 + removedCount * 4;
+    }
+    const records = new Float32Array(buffer, offset, count * recordSize);
+    const ids = new Uint32Array(buffer, offset, count * recordSize);
+    let data = {};
+    for (let i = 0; i < count; i++) {
+        const r = records.subarray(i * recordSize, (i + 1) * recordSize);
+        const id = ids[i * recordSize];
+        if (basic) {
+            data[id] = {location: [r[1], r[2]], rotation: r[3], vel: [r[4], r[5]], objType: r[6], timestamp: r[7]};
+            continue;
+        }
+        data[id] = {
+            location: [r[1], r[2]],
+            rotation: r[3],
+            vel: [r[4], r[5]],
+            objType: r[6],
+            xCoeffs: [r[7], r[8], r[9]],
+            yCoeffs: [r[10], r[11], r[12]],
+            timestamp: r[13]
+        };
+    }
+    if (isDelta) {
+        return {type: "TRACKING_DELTA", data: data, removed: removed, tickTime: tickTime};
+    }
+    return {type: "TRACKING", data: data, tickTime: tickTime};
+}
+
 function updateOrCreateSprite(id, data) {
     if (!(id in sprites)) {
         // create new sprite
@@ -82,7 +136,6 @@ function updateOrCreateSprite(id, data) {
     let sp = sprites[id];
     [sp.x, sp.y] = data.location;
     sp.rotation = data.rotation;
-    sp.lastUpdated = Date.now();
     return sp;
 }
 
@@ -111,21 +164,50 @@ app.loader.load(() => {
     // draw background
     app.stage.addChild(bgSprite);
 
-    // websocket setup
-    const ws = new WebSocket(`ws://${window.location.hostname}:8000/stream`);
-    ws.onmessage = (ev) => {
-        let ev_data = JSON.parse(ev.data);
-
-        if (ev_data.type !== "TRACKING") {
-            console.log(ev_data);
-            return;
-        }
+    // websocket setup, reconnecting whenever the connection drops
+    const connect = function () {
+        const ws = new WebSocket(`ws://${window.location.hostname}:8000/stream?format=binary&delta=1`);
+        ws.binaryType = "arraybuffer";
+        // deltas only apply on top of a full update, and the state of a previous connection is stale
+        let haveKeyframe = false;
+        let resyncRequested = false;
+        ws.onopen = () => {
+            detections = {};
+        };
+        ws.onmessage = (ev) => {
+            let ev_data = ev.data instanceof ArrayBuffer ? decodeBinaryTracking(ev.data) : JSON.parse(ev.data);
+
+            if (ev_data.type === "TRACKING") {
+                detections = ev_data.data;
+                haveKeyframe = true;
+            } else if (ev_data.type === "TRACKING_DELTA") {
+                if (!haveKeyframe) {
+                    if (!resyncRequested) {
+                        ws.send("RESYNC");
+                        resyncRequested = true;
+                    }
+                    return;
+                }
+                for (let id of ev_data.removed) {
+                    delete detections[id];
+                }
+                Object.assign(detections, ev_data.data);
+            } else {
+                console.log(ev_data);
+                return;
+            }
+            lastMessageAt = Date.now();
 
-        detections = ev_data.data;
-        for (let [id, obj] of Object.entries(detections)) {
-            updateOrCreateSprite(id, obj);
-        }
+            // unchanged objects keep animating from where they are
+            for (let [id, obj] of Object.entries(ev_data.data)) {
+                updateOrCreateSprite(id, obj);
+            }
+        };
+        ws.onclose = () => {
+            setTimeout(connect, RECONNECT_MS);
+        };
     };
+    connect();
 
     app.renderer.resize(app.renderer.width, app.renderer.height);
 
@@ -133,7 +215,7 @@ app.loader.load(() => {
         const ms = delta / settings.settings.TARGET_FPMS;
         for (let [id, sp] of Object.entries(sprites)) {
             // remove old sprites
-            if (Date.now() - sp.lastUpdated > SPRITE_TIMEOUT_MS || !(id in detections)) {
+            if (Date.now() - lastMessageAt > SPRITE_TIMEOUT_MS || !(id in detections)) {
                 app.stage.removeChild(sp);
                 delete sprites[id];
                 continue;
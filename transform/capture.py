@@ -0,0 +1,86 @@
+import collections
+import os
+import threading
+
+import cv2
+import pafy
+
+
+def stream_url(url):
+    """Return the URL to open for a config entry's `url`, which is either a local video file or a YouTube link.
+    """
+    if os.path.isfile(url):
+        return url
+    return pafy.new(url).getbest().url
+
+
+class FrameGrabber:
+    """
+    Drop-in replacement for `cv2.VideoCapture` that decodes on a background thread
+    into a ring buffer of `buffer_size` frames, so processing a frame never holds
+    up decoding the next one.
+    For live streams `read` hands out the newest frame and discards the older ones,
+    so the consumer never falls behind live. For local files (or with
+    `drop_stale=False`) every frame is delivered in order, and decoding waits while
+    the buffer is full. `decoded`, `dropped` and `delivered` count frames.
+    """
+
+    def __init__(self, source, buffer_size=2, drop_stale=None):
+        self.source = source
+        self.drop_stale = not os.path.isfile(str(source)) if drop_stale is None else drop_stale
+        self._capture = cv2.VideoCapture(source)
+        if not self._capture.isOpened():
+            raise IOError(f"Cannot open video source {source}")
+        self.fps = self._capture.get(cv2.CAP_PROP_FPS)
+        self.decoded = 0
+        self.dropped = 0
+        self.delivered = 0
+        self._frames = collections.deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._running = True
+        self._ended = False
+        self._thread = threading.Thread(target=self._decode, name=f"grabber {source}", daemon=True)
+        self._thread.start()
+
+    def _decode(self):
+        while self._running:
+            ret, frame = self._capture.read()
+            with self._condition:
+                if not ret:
+                    self._ended = True
+                    self._condition.notify_all()
+                    return
+                self.decoded += 1
+                if not self.drop_stale:
+                    self._condition.wait_for(lambda: len(self._frames) < self._frames.maxlen or not self._running)
+                elif len(self._frames) == self._frames.maxlen:
+                    self.dropped += 1
+                self._frames.append(frame)
+                self._condition.notify_all()
+
+    def isOpened(self):
+        return self._running and not (self._ended and not self._frames)
+
+    def read(self, timeout=None):
+        """Wait for a frame not returned before, like `cv2.VideoCapture.read`. Returns
+        `(False, None)` once the stream has ended, or if no frame arrived within `timeout` seconds.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._frames or self._ended, timeout) or not self._frames:
+                return False, None
+            if self.drop_stale:
+                self.dropped += len(self._frames) - 1
+                frame = self._frames.pop()
+                self._frames.clear()
+            else:
+                frame = self._frames.popleft()
+            self.delivered += 1
+            self._condition.notify_all()
+            return True, frame
+
+    def release(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+        self._capture.release()
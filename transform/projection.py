@@ -0,0 +1,245 @@
+"""
+Projection of camera image coordinates onto the aerial map, for trackers that
+report detections in camera pixels.
+
+A camera's calibration (see `transform/config.json`) is the lens correction used
+to undistort its frames, and the homography from the undistorted frame to the
+1280 pixel wide aerial image. Both are applied here with NumPy alone, vectorised
+over any number of points, mirroring OpenCV's `undistortPoints` and
+`getOptimalNewCameraMatrix` so positions line up with the transform tools.
+
+The backend and the transform tools are deployed separately, so
+`transform/projection.py` is a verbatim copy of `backend/projection.py`.
+Edit the backend file and copy it over; `backend/tests/test_projection.py`
+fails while the two differ.
+"""
+import json
+import logging
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# free scaling parameter of the undistorted frame, as used by `transform/undistort.py`
+DEFAULT_ALPHA = 0.15
+UNDISTORT_ITERATIONS = 5
+# values per raw tracker record, see `TrackedFrame.from_np`
+RECORD_SIZE = 13
+
+
+def _coefficients(dist_coeffs: np.ndarray) -> np.ndarray:
+    k = np.zeros(8)
+    k[:len(dist_coeffs)] = dist_coeffs
+    return k
+
+
+def _distortion_jacobian(x: np.ndarray, y: np.ndarray,
+                         k: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Derivatives of distorted by undistorted normalised coordinates, as the row major
+    elements of a 2x2 matrix per point.
+    """
+    r2 = x * x + y * y
+    num = 1 + ((k[4] * r2 + k[1]) * r2 + k[0]) * r2
+    den = 1 + ((k[7] * r2 + k[6]) * r2 + k[5]) * r2
+    d_num = (3 * k[4] * r2 + 2 * k[1]) * r2 + k[0]
+    d_den = (3 * k[7] * r2 + 2 * k[6]) * r2 + k[5]
+    radial = num / den
+    # derivative of the radial factor by r2, times 2 for the derivative of r2 by x or y
+    d_radial = 2 * (d_num * den - num * d_den) / (den * den)
+    cross = x * y * d_radial + 2 * k[2] * x + 2 * k[3] * y
+    return (radial + x * x * d_radial + 2 * k[2] * y + 6 * k[3] * x, cross,
+            cross, radial + y * y * d_radial + 6 * k[2] * y + 2 * k[3] * x)
+
+
+def undistort_normalised(points: np.ndarray, camera_matrix: np.ndarray, dist_coeffs: np.ndarray) -> np.ndarray:
+    """Map `(N, 2)` distorted pixels to normalised undistorted camera coordinates by
+    fixed point iteration, like `cv2.undistortPoints` without `R` and `P`.
+    """
+    k = _coefficients(dist_coeffs)
+    x0 = (points[:, 0] - camera_matrix[0, 2]) / camera_matrix[0, 0]
+    y0 = (points[:, 1] - camera_matrix[1, 2]) / camera_matrix[1, 1]
+    # most calibrations have neither rational nor tangential terms, which saves half the work
+    rational, tangential = k[5:].any(), k[2:4].any()
+    x, y = x0, y0
+    for _ in range(UNDISTORT_ITERATIONS):
+        r2 = x * x + y * y
+        inverse_radial = 1 / (1 + ((k[4] * r2 + k[1]) * r2 + k[0]) * r2)
+        if rational:
+            inverse_radial *= 1 + ((k[7] * r2 + k[6]) * r2 + k[5]) * r2
+        if tangential:
+            x, y = ((x0 - 2 * k[2] * x * y - k[3] * (r2 + 2 * x * x)) * inverse_radial,
+                    (y0 - k[2] * (r2 + 2 * y * y) - 2 * k[3] * x * y) * inverse_radial)
+        else:
+            x, y = x0 * inverse_radial, y0 * inverse_radial
+    return np.stack((x, y), axis=1)
+
+
+def optimal_new_camera_matrix(camera_matrix: np.ndarray, dist_coeffs: np.ndarray, frame_size: Tuple[int, int],
+                              alpha: float = DEFAULT_ALPHA) -> np.ndarray:
+    """Camera matrix of the undistorted frame, interpolating between keeping only
+    valid pixels (`alpha=0`) and keeping all source pixels (`alpha=1`), like
+    `cv2.getOptimalNewCameraMatrix` with the new size equal to `frame_size`.
+    """
+    w, h = frame_size
+    n = 9
+    grid_x, grid_y = np.meshgrid(np.arange(n) * (w - 1) / (n - 1), np.arange(n) * (h - 1) / (n - 1))
+    grid = undistort_normalised(np.stack((grid_x.ravel(), grid_y.ravel()), axis=1), camera_matrix,
+                                dist_coeffs).reshape(n, n, 2)
+    # largest rectangle inside the undistorted frame, and smallest rectangle around it
+    inner = (grid[:, 0, 0].max(), grid[0, :, 1].max(), grid[:, -1, 0].min(), grid[-1, :, 1].min())
+    outer = (grid[..., 0].min(), grid[..., 1].min(), grid[..., 0].max(), grid[..., 1].max())
+
+    def viewport(rect: Tuple[float, float, float, float]) -> np.ndarray:
+        x0, y0, x1, y1 = rect
+        fx, fy = (w - 1) / (x1 - x0), (h - 1) / (y1 - y0)
+        return np.array([fx, fy, -fx * x0, -fy * y0])
+
+    fx, fy, cx, cy = (1 - alpha) * viewport(inner) + alpha * viewport(outer)
+    return np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]])
+
+
+class CameraProjection:
+    """
+    Maps camera pixels to aerial image pixels, scaled by `aerial_scale` and shifted
+    by `aerial_offset` into the caller's map coordinates. Without a lens correction
+    only the homography is applied. With one, `frame_size` must be the (width,
+    height) the camera was calibrated at, as it determines the undistorted frame.
+    Points are `(N, 2)` arrays, and every method is vectorised, so the cost per
+    point is a few dozen floating point operations.
+    """
+
+    def __init__(self, homography: np.ndarray, camera_matrix: Optional[np.ndarray] = None,
+                 dist_coeffs: Optional[Sequence[float]] = None, frame_size: Optional[Tuple[int, int]] = None,
+                 alpha: float = DEFAULT_ALPHA, aerial_scale: float = 1.0, aerial_offset: Tuple[float, float] = (0, 0)):
+        self.homography = np.asarray(homography, dtype=np.float64)
+        self.camera_matrix = None if camera_matrix is None else np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = None if dist_coeffs is None else np.asarray(dist_coeffs, dtype=np.float64)
+        scale = np.diag([aerial_scale, aerial_scale, 1.0])
+        scale[:2, 2] = aerial_offset
+        # undistorted pixels -> map coordinates
+        self._pixel_to_map = scale @ self.homography
+        # normalised undistorted camera coordinates -> map coordinates
+        self._normalised_to_map = None
+        if self.camera_matrix is not None:
+            if frame_size is None:
+                raise ValueError("The frame size is required to undistort points")
+            new_cam = optimal_new_camera_matrix(self.camera_matrix, self.dist_coeffs, frame_size, alpha)
+            self._normalised_to_map = self._pixel_to_map @ new_cam
+
+    @classmethod
+    def from_config_entry(cls, entry: dict, **kwargs) -> 'CameraProjection':
+        """Build the projection of a camera entry of `transform/config.json`.
+        Raises:
+            ValueError: If the entry has no homography, or has a lens correction but no frame size.
+        """
+        if not entry.get('transform'):
+            raise ValueError("The camera has no homography, run transform/stream.py to calibrate it")
+        correction = entry.get('correction') or {}
+        if correction and not entry.get('frameSize'):
+            raise ValueError("The camera's frame size is unknown, run transform/stream.py to record it")
+        frame_size = tuple(entry['frameSize']) if entry.get('frameSize') else None
+        return cls(entry['transform'], correction.get('camMatrix'), correction.get('distCoeffs'),
+                   frame_size=frame_size, **kwargs)
+
+    @staticmethod
+    def _apply(matrix: np.ndarray, points: np.ndarray) -> np.ndarray:
+        x, y = points[:, 0], points[:, 1]
+        w = x * matrix[2, 0] + y * matrix[2, 1] + matrix[2, 2]
+        projected = np.empty_like(points)
+        projected[:, 0] = (x * matrix[0, 0] + y * matrix[0, 1] + matrix[0, 2]) / w
+        projected[:, 1] = (x * matrix[1, 0] + y * matrix[1, 1] + matrix[1, 2]) / w
+        return projected
+
+    @staticmethod
+    def _apply_derivative(matrix: np.ndarray, points: np.ndarray, projected: np.ndarray) -> np.ndarray:
+        """`(N, 2, 2)` derivatives of the homography `matrix` at `points`, which it maps to `projected`.
+        """
+        w = points[:, 0] * matrix[2, 0] + points[:, 1] * matrix[2, 1] + matrix[2, 2]
+        derivative = np.empty((len(points), 2, 2))
+        for i in range(2):
+            for j in range(2):
+                derivative[:, i, j] = (matrix[i, j] - projected[:, i] * matrix[2, j]) / w
+        return derivative
+
+    def to_map(self, points: np.ndarray, distorted: bool = True) -> np.ndarray:
+        """Project camera pixels to map coordinates. Pass `distorted=False` for
+        pixels of the already undistorted frame, as shown by the transform tools.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not distorted or self._normalised_to_map is None:
+            return self._apply(self._pixel_to_map, points)
+        return self._apply(self._normalised_to_map, undistort_normalised(points, self.camera_matrix,
+                                                                         self.dist_coeffs))
+
+    def _map_with_derivative(self, points: np.ndarray, extra: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Project `points` and `extra` points in one call, returning the analytic
+        `(N, 2, 2)` derivatives at `points` too.
+        """
+        n = len(points)
+        points = np.concatenate((points, extra))
+        if self._normalised_to_map is None:
+            projected = self._apply(self._pixel_to_map, points)
+            return projected[:n], self._apply_derivative(self._pixel_to_map, points[:n], projected[:n]), projected[n:]
+        normalised = undistort_normalised(points, self.camera_matrix, self.dist_coeffs)
+        projected = self._apply(self._normalised_to_map, normalised)
+        # chain the homography through the inverse of the distortion, and pixels to normalised coordinates
+        a, b, c, d = _distortion_jacobian(normalised[:n, 0], normalised[:n, 1], _coefficients(self.dist_coeffs))
+        det = a * d - b * c
+        fx, fy = self.camera_matrix[0, 0] * det, self.camera_matrix[1, 1] * det
+        inverse = ((d / fx, -b / fy), (-c / fx, a / fy))
+        homography = self._apply_derivative(self._normalised_to_map, normalised[:n], projected[:n])
+        derivative = np.empty((n, 2, 2))
+        for i in range(2):
+            for j in range(2):
+                derivative[:, i, j] = homography[:, i, 0] * inverse[0][j] + homography[:, i, 1] * inverse[1][j]
+        return projected[:n], derivative, projected[n:]
+
+    def project_records(self, records: np.ndarray) -> np.ndarray:
+        """Convert `(N, 13)` raw tracker records (see `TrackedFrame.from_np`) from
+        camera pixels to map coordinates: positions are projected, while speeds,
+        headings and the trajectory coefficients are mapped through the local derivative.
+        Raises:
+            ValueError: If the array has the wrong shape.
+        """
+        if records.ndim != 2 or records.shape[1] != RECORD_SIZE:
+            raise ValueError(f"Expected an (N, {RECORD_SIZE}) array, got {records.shape}")
+        records = records.astype(np.float64)
+        # records without a fit have all coefficients zero, and must keep them
+        fitted = np.flatnonzero((records[:, 7:13] != 0).any(axis=1))
+        position, derivative, origins = self._map_with_derivative(records[:, 1:3], records[fitted][:, [9, 12]])
+        records[:, 1:3] = position
+        # headings are counter-clockwise with y pointing up, pixels have y pointing down
+        rot, speed = records[:, 3], records[:, 4]
+        vx, vy = speed * np.cos(rot), -speed * np.sin(rot)
+        # elementwise products, as batched 2x2 matmul and einsum are several times slower
+        map_vx = derivative[:, 0, 0] * vx + derivative[:, 0, 1] * vy
+        map_vy = derivative[:, 1, 0] * vx + derivative[:, 1, 1] * vy
+        records[:, 3] = np.arctan2(-map_vy, map_vx)
+        records[:, 4] = np.hypot(map_vx, map_vy)
+        if len(fitted):
+            # x(t) = xa * t**2 + xb * t + xc, so xa and xb transform like velocities and xc like a position
+            derivative = derivative[fitted]
+            coeffs = records[fitted]
+            for x_column, y_column in ((7, 10), (8, 11)):
+                x, y = coeffs[:, x_column], coeffs[:, y_column]
+                records[fitted, x_column] = derivative[:, 0, 0] * x + derivative[:, 0, 1] * y
+                records[fitted, y_column] = derivative[:, 1, 0] * x + derivative[:, 1, 1] * y
+            records[fitted, 9] = origins[:, 0]
+            records[fitted, 12] = origins[:, 1]
+        return records
+
+
+def load_projections(path: str, **kwargs) -> Dict[str, CameraProjection]:
+    """Load the projection of every calibrated camera in a `transform/config.json` file,
+    skipping cameras whose calibration is incomplete.
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    projections = {}
+    for name, entry in entries.items():
+        try:
+            projections[name] = CameraProjection.from_config_entry(entry, **kwargs)
+        except ValueError as e:
+            logger.warning("Cannot project camera %s: %s", name, e)
+    return projections
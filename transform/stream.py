@@ -1,17 +1,15 @@
 import cv2
 import numpy as np
-import pafy
 
-from undistort import undistort_img
-from util import read_config_entry, write_config_entry
+from capture import FrameGrabber, stream_url
+from undistort import AerialProjector, Rectifier
+from util import CalibrationRegistry, read_config_entry, write_config_entry
 
 CAM_NAME = 'pizzeria'
 
 cam_config = read_config_entry(CAM_NAME)
 
 url = cam_config['url']
-vid = pafy.new(url)
-play = vid.getbest()
 
 stream_window_name = 'Stream'
 reference_window_name = 'Reference'
@@ -60,16 +58,38 @@ scaled_shape = (int(aerial_image.shape[1] * scale),
 print(scaled_shape)
 aerial_image = cv2.resize(aerial_image, scaled_shape)
 
-cap = cv2.VideoCapture(play.url)
+cap = FrameGrabber(stream_url(url))
+
+registry = CalibrationRegistry()
+calibration = None
+rectifier = Rectifier()
+undistorted = None
+camera_matrix, distortion_coeffs = None, None
+if corrections := cam_config['correction']:
+    camera_matrix = np.array(corrections['camMatrix'])
+    distortion_coeffs = np.array(corrections['distCoeffs'])
+projector = None
+blended = None
 
 homography = np.array(cam_config['transform']) if cam_config['transform'] else None
+homography_pts = 0
+frame_size = None
 while True:
-    ret, frame = cap.read()
+    ret, raw_frame = cap.read()
+    if not ret:
+        break
+
+    frame_size = raw_frame.shape[1::-1]
+    if calibration is None:
+        # reuse the tables compiled by an earlier run, unless the camera's config.json entry changed
+        calibration = registry.load(CAM_NAME, frame_size, scaled_shape)
+        if corrections:
+            rectifier.add_maps(camera_matrix, distortion_coeffs, frame_size,
+                               (calibration['undistort_map_1'], calibration['undistort_map_2']))
 
-    if corrections := cam_config['correction']:
-        camera_matrix = np.array(corrections['camMatrix'])
-        distortion_coeffs = np.array(corrections['distCoeffs'])
-        frame = undistort_img(camera_matrix, distortion_coeffs, frame)
+    frame = raw_frame
+    if corrections:
+        frame = undistorted = rectifier.undistort(camera_matrix, distortion_coeffs, raw_frame, undistorted)
 
     cv2.resizeWindow(stream_window_name, 1280, 720)
     cv2.imshow(stream_window_name, draw_points(frame, clicked_pts_stream))
@@ -78,24 +98,34 @@ while True:
 
     # recompute homography
     pts_len = min(len(clicked_pts_reference), len(clicked_pts_stream))
-    if pts_len >= 4:
+    if pts_len >= 4 and pts_len != homography_pts:
         src_pts = np.array(clicked_pts_stream[:pts_len])
         dst_pts = np.array(clicked_pts_reference[:pts_len])
         homography, mask = cv2.findHomography(src_pts, dst_pts)
+        homography_pts = pts_len
+        projector = None
     if homography is not None:
-        transformed = cv2.warpPerspective(frame, homography, scaled_shape)
-        transformed = cv2.addWeighted(transformed, 0.5, aerial_image, 0.5, 0.0)
-        cv2.imshow('trans', transformed)
+        if projector is None:
+            # the compiled tables only match the homography read from config.json
+            maps = None
+            if homography_pts == 0 and 'aerial_map_1' in calibration:
+                maps = calibration['aerial_map_1'], calibration['aerial_map_2']
+            projector = AerialProjector(homography, scaled_shape, frame_size, camera_matrix, distortion_coeffs,
+                                        maps=maps)
+        transformed = projector.warp(raw_frame)
+        blended = cv2.addWeighted(transformed, 0.5, aerial_image, 0.5, 0.0, dst=blended)
+        cv2.imshow('trans', blended)
 
     key_val = cv2.waitKey(20)
     if key_val & 0xFF == ord('r'):
         clicked_pts_stream.clear()
         clicked_pts_reference.clear()
+        homography_pts = 0
     elif key_val & 0xFF == ord('q'):
         break
 
 if homography is not None:
-    write_config_entry(CAM_NAME, transform=homography.tolist())
+    write_config_entry(CAM_NAME, transform=homography.tolist(), frame_size=frame_size)
 
 cap.release()
 cv2.destroyAllWindows()
@@ -1,17 +1,16 @@
 import cv2
 import numpy as np
-import pafy
 
-from undistort import undistort_img
-from util import read_config_entry
+from capture import FrameGrabber, stream_url
+from projection import CameraProjection
+from undistort import AerialProjector, Rectifier
+from util import CalibrationRegistry, read_config_entry
 
 CAM_NAME = 'pizzeria'
 
 cam_config = read_config_entry(CAM_NAME)
 
 url = cam_config['url']
-vid = pafy.new(url)
-play = vid.getbest()
 
 stream_window_name = 'Stream'
 reference_window_name = 'Reference'
@@ -20,6 +19,8 @@ clicked_pts_stream = []
 clicked_pts_reference = []
 
 homography = np.array(cam_config['transform'])
+# clicks are on the undistorted frame, so only the homography is needed
+projection = CameraProjection(homography)
 
 
 def add_coords(a, b):
@@ -30,9 +31,9 @@ def add_coords(a, b):
 
 def on_click_stream(event, x, y, flags, param):
     if event == cv2.EVENT_LBUTTONDOWN:
-        pts = np.array([(x, y), (1851, 425.5), (1645, 565), (1630.5, 466), (683, 491)], dtype="float32")
-        pts = np.array([pts])
-        t = cv2.perspectiveTransform(pts, homography)[0]
+        # the stream window shows the undistorted frame
+        pts = np.array([(x, y), (1851, 425.5), (1645, 565), (1630.5, 466), (683, 491)])
+        t = projection.to_map(pts, distorted=False)
         print(pts, '\n', t)
 
 
@@ -48,21 +49,44 @@ scaled_shape = (int(aerial_image.shape[1] * scale),
 print(scaled_shape)
 aerial_image = cv2.resize(aerial_image, scaled_shape)
 
-cap = cv2.VideoCapture(play.url)
+cap = FrameGrabber(stream_url(url))
+
+registry = CalibrationRegistry()
+calibration = None
+rectifier = Rectifier()
+undistorted = None
+camera_matrix, distortion_coeffs = None, None
+if corrections := cam_config['correction']:
+    camera_matrix = np.array(corrections['camMatrix'])
+    distortion_coeffs = np.array(corrections['distCoeffs'])
+projector = None
+blended = None
 while True:
-    ret, frame = cap.read()
+    ret, raw_frame = cap.read()
+    if not ret:
+        break
+
+    frame_size = raw_frame.shape[1::-1]
+    if calibration is None:
+        # reuse the tables compiled by an earlier run, unless the camera's config.json entry changed
+        calibration = registry.load(CAM_NAME, frame_size, scaled_shape)
+        if corrections:
+            rectifier.add_maps(camera_matrix, distortion_coeffs, frame_size,
+                               (calibration['undistort_map_1'], calibration['undistort_map_2']))
 
-    if corrections := cam_config['correction']:
-        camera_matrix = np.array(corrections['camMatrix'])
-        distortion_coeffs = np.array(corrections['distCoeffs'])
-        frame = undistort_img(camera_matrix, distortion_coeffs, frame)
+    frame = raw_frame
+    if corrections:
+        frame = undistorted = rectifier.undistort(camera_matrix, distortion_coeffs, raw_frame, undistorted)
 
     cv2.resizeWindow(stream_window_name, 1280, 720)
     cv2.imshow(stream_window_name, frame)
 
-    transformed = cv2.warpPerspective(frame, homography, scaled_shape)
-    transformed = cv2.addWeighted(transformed, 0.5, aerial_image, 0.5, 0.0)
-    cv2.imshow('trans', transformed)
+    if projector is None:
+        projector = AerialProjector(homography, scaled_shape, frame_size, camera_matrix, distortion_coeffs,
+                                    maps=(calibration['aerial_map_1'], calibration['aerial_map_2']))
+    transformed = projector.warp(raw_frame)
+    blended = cv2.addWeighted(transformed, 0.5, aerial_image, 0.5, 0.0, dst=blended)
+    cv2.imshow('trans', blended)
 
     key_val = cv2.waitKey(20)
     if key_val & 0xFF == ord('q'):
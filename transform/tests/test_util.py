@@ -0,0 +1,50 @@
+import builtins
+import importlib
+import os
+import stat
+import sys
+import types
+
+import pytest
+
+import util
+
+
+@pytest.fixture
+def config_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_write_config_entry_keeps_file_mode(config_dir):
+    path = config_dir / util.CONFIG_FILENAME
+    path.write_text('{}')
+    os.chmod(path, 0o644)
+    util.write_config_entry('pub', cam_url='video.mp4')
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    assert util.read_config_entry('pub')['url'] == 'video.mp4'
+
+
+def test_new_config_file_follows_umask(config_dir):
+    umask = os.umask(0o022)
+    try:
+        util.write_config_entry('pub', cam_url='video.mp4')
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(config_dir / util.CONFIG_FILENAME).st_mode) == 0o644
+
+
+def test_util_imports_without_fcntl(monkeypatch):
+    real_import = builtins.__import__
+
+    def no_fcntl(name, *args, **kwargs):
+        if name == 'fcntl':
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', no_fcntl)
+    monkeypatch.setitem(sys.modules, 'msvcrt', types.ModuleType('msvcrt'))
+    monkeypatch.delitem(sys.modules, 'fcntl', raising=False)
+    monkeypatch.delitem(sys.modules, 'util')
+    windows_util = importlib.import_module('util')
+    assert windows_util.fcntl is None
@@ -1,23 +1,114 @@
-import time
+import collections
 import tkinter as tk
 
 import cv2
 import numpy as np
-import pafy
 
+from capture import FrameGrabber, stream_url
 from util import read_config_entry, write_config_entry
 
 camera_matrix, dist_coeffs = None, None
 
 CAM_NAME = 'square'
+DEFAULT_ALPHA = 0.15
+
+
+def undistort_maps(camera_matrix, dist_coeffs, size, alpha=DEFAULT_ALPHA):
+    new_cam, roi = cv2.getOptimalNewCameraMatrix(camera_matrix, dist_coeffs, size, alpha, size)
+    return cv2.initUndistortRectifyMap(camera_matrix, dist_coeffs, None, new_cam, size, cv2.CV_16SC2)
+
+
+def aerial_maps(homography, aerial_size, frame_size, camera_matrix=None, dist_coeffs=None, alpha=DEFAULT_ALPHA,
+                roi=None):
+    x, y, w, h = roi or (0, 0, *aerial_size)
+    if camera_matrix is None:
+        camera_matrix, dist_coeffs, new_cam = np.eye(3), None, np.eye(3)
+    else:
+        camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64)
+        new_cam, _ = cv2.getOptimalNewCameraMatrix(camera_matrix, dist_coeffs, frame_size, alpha, frame_size)
+    # output pixel -> undistorted frame pixel -> normalised camera coordinates is the inverse of this matrix
+    aerial_from_camera = np.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]]) @ np.asarray(homography) @ new_cam
+    return cv2.initUndistortRectifyMap(camera_matrix, dist_coeffs, np.eye(3), aerial_from_camera, (w, h),
+                                       cv2.CV_16SC2)
+
+
+class Rectifier:
+    """
+    Undistorts frames with remap tables that are computed once per camera matrix,
+    distortion coefficients and frame size, and kept in an LRU cache of `max_maps`
+    entries, so changing the correction in config.json simply selects new tables.
+    The tables are in the fixed-point CV_16SC2 format, which remaps faster and
+    takes half the memory of float maps.
+    """
+
+    def __init__(self, alpha=DEFAULT_ALPHA, max_maps=4):
+        self.alpha = alpha
+        self.max_maps = max_maps
+        self._maps = collections.OrderedDict()
+
+    @staticmethod
+    def _key(camera_matrix, dist_coeffs, size):
+        return (np.asarray(camera_matrix, dtype=np.float64).tobytes(),
+                np.asarray(dist_coeffs, dtype=np.float64).tobytes(), tuple(size))
+
+    def add_maps(self, camera_matrix, dist_coeffs, size, maps):
+        """Use precomputed tables, e.g. from a :class:`~util.CalibrationRegistry`.
+        """
+        key = self._key(camera_matrix, dist_coeffs, size)
+        self._maps[key] = maps
+        self._maps.move_to_end(key)
+        if len(self._maps) > self.max_maps:
+            self._maps.popitem(last=False)
+
+    def maps(self, camera_matrix, dist_coeffs, size):
+        key = self._key(camera_matrix, dist_coeffs, size)
+        maps = self._maps.get(key)
+        if maps is None:
+            maps = undistort_maps(np.asarray(camera_matrix, dtype=np.float64),
+                                  np.asarray(dist_coeffs, dtype=np.float64), size, self.alpha)
+            self.add_maps(camera_matrix, dist_coeffs, size, maps)
+        else:
+            self._maps.move_to_end(key)
+        return maps
+
+    def undistort(self, camera_matrix, dist_coeffs, input_img, output_img=None):
+        h, w = input_img.shape[:2]
+        map_1, map_2 = self.maps(camera_matrix, dist_coeffs, (w, h))
+        return cv2.remap(input_img, map_1, map_2, cv2.INTER_LINEAR, dst=output_img)
+
+
+class AerialProjector:
+    """
+    Warps camera frames straight onto the aerial view in a single remap. The lens
+    correction (if any) and the `homography` from the undistorted frame to the
+    aerial view are composed into one CV_16SC2 table when the projector is made,
+    so every output pixel is read once from the raw frame, with no intermediate
+    image. With `roi=(x, y, w, h)` only that part of the aerial view is rendered.
+    `warp` writes into the same preallocated buffer on every call. Precomputed
+    tables, e.g. from a :class:`~util.CalibrationRegistry`, can be passed as `maps`.
+    """
+
+    def __init__(self, homography, aerial_size, frame_size, camera_matrix=None, dist_coeffs=None,
+                 alpha=DEFAULT_ALPHA, roi=None, maps=None):
+        x, y, w, h = roi or (0, 0, *aerial_size)
+        self.size = (w, h)
+        if maps is None:
+            maps = aerial_maps(homography, aerial_size, frame_size, camera_matrix, dist_coeffs, alpha, roi)
+        self._map_1, self._map_2 = maps
+        self._output = None
+
+    def warp(self, frame):
+        if self._output is None or self._output.shape[2:] != frame.shape[2:] or self._output.dtype != frame.dtype:
+            self._output = np.empty((self.size[1], self.size[0]) + frame.shape[2:], dtype=frame.dtype)
+        return cv2.remap(frame, self._map_1, self._map_2, cv2.INTER_LINEAR, dst=self._output)
+
+
+_rectifier = Rectifier()
 
 
 def undistort_img(camera_matrix, dist_coeffs, input_img):
-    h, w, _ = input_img.shape
-    dim = (w, h)
-    new_cam, roi = cv2.getOptimalNewCameraMatrix(camera_matrix, dist_coeffs, dim, 0.15, dim)
-    map_x, map_y = cv2.initUndistortRectifyMap(camera_matrix, dist_coeffs, None, new_cam, dim, cv2.CV_32FC1)
-    return cv2.remap(input_img, map_x, map_y, cv2.INTER_LINEAR)
+    return _rectifier.undistort(camera_matrix, dist_coeffs, input_img)
 
 
 def callback(val):
@@ -42,16 +133,15 @@ def callback(val):
         [k_1, k_2, p_1, p_2, k_3]
     )
 
-    write_config_entry(CAM_NAME, dist_corr=(camera_matrix.tolist(), dist_coeffs.tolist()))
+    write_config_entry(CAM_NAME, dist_corr=(camera_matrix.tolist(), dist_coeffs.tolist()),
+                       frame_size=(img_width, img_height))
 
     return True
 
 
 if __name__ == '__main__':
     config = read_config_entry(CAM_NAME)
-    vid = pafy.new(config['url'])
-    play = vid.getbest()
-    cap = cv2.VideoCapture(play.url)
+    cap = FrameGrabber(stream_url(config['url']))
 
     ret, img = cap.read()
     img_height, img_width, _ = img.shape
@@ -108,7 +198,9 @@ if __name__ == '__main__':
 
     while True:
         ret, img = cap.read()
-        time.sleep(0.01)
+        if not ret:
+            break
         master.update()
         t_frame = undistort_img(camera_matrix, dist_coeffs, img)
         cv2.imshow('Undistorted', t_frame)
+    cap.release()
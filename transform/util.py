@@ -1,6 +1,25 @@
+import contextlib
+import copy
+import hashlib
 import json
+import os
+import shutil
+import stat
+import tempfile
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 CONFIG_FILENAME = "config.json"
+CONFIG_LOCK_FILENAME = CONFIG_FILENAME + ".lock"
+ARTIFACT_DIRNAME = "calibration"
+# bump when the compiled artifacts change, so stale ones are rebuilt
+ARTIFACT_VERSION = 1
 DEFAULT_CAM_URLS = {
     'pizzeria': "https://youtu.be/1EiC9bvVGnk",
     'pub': "https://youtu.be/6aJXND_Lfk8",
@@ -12,8 +31,11 @@ DEFAULT_TEMPLATE = {
     'correction': None
 }
 
+# (path, inode, modification time) -> parsed config
+_config_cache = {}
 
-def _config_entry(name, cam_url=None, transform=None, dist_corr=None) -> dict:
+
+def _config_entry(name, cam_url=None, transform=None, dist_corr=None, frame_size=None) -> dict:
     # Read existing config if it exists
     try:
         old_entry = read_config_entry(name)
@@ -31,17 +53,28 @@ def _config_entry(name, cam_url=None, transform=None, dist_corr=None) -> dict:
             'camMatrix': cam_mat,
             'distCoeffs': coeffs
         }
+    if frame_size:
+        # size the camera was calibrated at, see backend/projection.py
+        new_entry['frameSize'] = [int(frame_size[0]), int(frame_size[1])]
 
     return {**DEFAULT_TEMPLATE, **old_entry, **new_entry}
 
 
 def _read_config() -> dict:
+    """Parse the config file, reusing the last parse while the file is unchanged.
+    Every write replaces the file, so a new inode also marks a change.
+    """
     try:
+        stat = os.stat(CONFIG_FILENAME)
+    except FileNotFoundError:
+        return {k: {**DEFAULT_TEMPLATE, 'url': v} for k, v in DEFAULT_CAM_URLS.items()}
+    key = (os.path.abspath(CONFIG_FILENAME), stat.st_ino, stat.st_mtime_ns)
+    if key not in _config_cache:
         with open(CONFIG_FILENAME, 'r') as config_file:
             conf = json.load(config_file)
-    except FileNotFoundError:
-        conf = {k: {**DEFAULT_TEMPLATE, 'url': v} for k, v in DEFAULT_CAM_URLS.items()}
-    return conf
+        _config_cache.clear()
+        _config_cache[key] = conf
+    return copy.deepcopy(_config_cache[key])
 
 
 def read_config_entry(key) -> dict:
@@ -49,8 +82,163 @@ def read_config_entry(key) -> dict:
     return conf[key]
 
 
+def _atomic_write(path, write):
+    """Write a file through `write(file)` into a temporary file next to `path`, then
+    rename it over `path`, so readers never see a partly written file. The file keeps
+    the permissions of the one it replaces, rather than the private ones of `mkstemp`.
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as tmp_file:
+            write(tmp_file)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def _config_lock():
+    """Hold an exclusive lock on the config file across processes, so concurrent
+    updates of different cameras do not overwrite each other.
+    """
+    with open(CONFIG_LOCK_FILENAME, 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            # msvcrt locks bytes from the current position, and gives up after about 10 s
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
 def write_config_entry(key, **kwargs):
-    conf = _read_config()
-    conf[key] = _config_entry(key, **kwargs)
-    with open(CONFIG_FILENAME, 'w') as config_file:
-        json.dump(conf, config_file, indent=2)
+    with _config_lock():
+        conf = _read_config()
+        conf[key] = _config_entry(key, **kwargs)
+        _atomic_write(CONFIG_FILENAME, lambda config_file: json.dump(conf, config_file, indent=2))
+
+
+class Calibration:
+    """
+    Compiled calibration of one camera: NumPy arrays by name, memory mapped from
+    the artifact directory. `transform` and the `aerial_map_*` tables are present
+    if the camera has a homography, `camera_matrix`, `dist_coeffs` and the
+    `undistort_map_*` tables if it has a lens correction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='r')
+                       for name in os.listdir(path) if name.endswith('.npy')}
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def get(self, name):
+        return self.arrays.get(name)
+
+
+class CalibrationRegistry:
+    """
+    Compiles camera entries of the config file into binary artifacts, so tools and
+    workers start without rebuilding matrices and remap tables: the matrices, the
+    undistortion tables and the fused aerial projection tables (see `undistort.py`)
+    are saved as `.npy` files and memory mapped on load. Artifacts are versioned by
+    a hash of the entry and kept per frame and aerial size, so a changed entry is
+    recompiled on its next load, and written to a temporary directory which is
+    then renamed into place, so concurrent loaders never see partial artifacts.
+    Once an entry has changed, the artifacts of its earlier versions are deleted.
+    """
+
+    def __init__(self, artifact_dir=ARTIFACT_DIRNAME):
+        self.artifact_dir = artifact_dir
+
+    @staticmethod
+    def version(entry) -> str:
+        source = json.dumps({'entry': entry, 'version': ARTIFACT_VERSION}, sort_keys=True)
+        return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _dirname(name, version, frame_size, aerial_size) -> str:
+        # split back with rsplit('-', 3), camera names may contain dashes
+        return f"{name}-{version}-{frame_size[0]}x{frame_size[1]}-{aerial_size[0]}x{aerial_size[1]}"
+
+    @staticmethod
+    def compile(entry, frame_size, aerial_size) -> dict:
+        # undistort.py reads the config through this module
+        from undistort import aerial_maps, undistort_maps  # pylint: disable=import-outside-toplevel
+
+        arrays = {}
+        camera_matrix = dist_coeffs = None
+        if correction := entry.get('correction'):
+            camera_matrix = np.array(correction['camMatrix'], dtype=np.float64)
+            dist_coeffs = np.array(correction['distCoeffs'], dtype=np.float64)
+            arrays['camera_matrix'], arrays['dist_coeffs'] = camera_matrix, dist_coeffs
+            arrays['undistort_map_1'], arrays['undistort_map_2'] = undistort_maps(camera_matrix, dist_coeffs,
+                                                                                  tuple(frame_size))
+        if transform := entry.get('transform'):
+            arrays['transform'] = np.array(transform, dtype=np.float64)
+            arrays['aerial_map_1'], arrays['aerial_map_2'] = aerial_maps(arrays['transform'], tuple(aerial_size),
+                                                                         tuple(frame_size), camera_matrix, dist_coeffs)
+        return arrays
+
+    def load(self, name, frame_size, aerial_size) -> Calibration:
+        """Load the artifacts of a camera for frames of `frame_size` and an aerial view
+        of `aerial_size` (both width, height), compiling them first if needed.
+        Raises:
+            KeyError: If the camera is not in the config file.
+        """
+        entry = read_config_entry(name)
+        version = self.version(entry)
+        path = os.path.join(self.artifact_dir, self._dirname(name, version, frame_size, aerial_size))
+        if not os.path.isdir(path):
+            self._write(path, self.compile(entry, frame_size, aerial_size))
+            self._remove_stale(name, version)
+        return Calibration(path)
+
+    def _write(self, path, arrays):
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=self.artifact_dir, prefix='.tmp-')
+        try:
+            for array_name, array in arrays.items():
+                np.save(os.path.join(tmp_path, array_name + '.npy'), array)
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            # unless compiled concurrently by another process
+            if not os.path.isdir(path):
+                raise
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    def _remove_stale(self, name, version):
+        """Delete the artifacts of earlier versions of a camera's entry, for any sizes.
+        """
+        for dirname in os.listdir(self.artifact_dir):
+            parts = dirname.rsplit('-', 3)
+            if len(parts) == 4 and parts[0] == name and parts[1] != version:
+                shutil.rmtree(os.path.join(self.artifact_dir, dirname), ignore_errors=True)